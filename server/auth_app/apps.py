@@ -13,6 +13,8 @@ class AuthConfig(AppConfig):
         Validate environment variables when the app starts.
         """
 
+        from . import signals  # noqa: F401
+
         # List of commands to skip environment validation
         skip_validation_commands = {
             "collectstatic",
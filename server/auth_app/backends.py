@@ -1,6 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.backends import ModelBackend
 
+from server.metrics import PASSWORD_HASH_SECONDS
+
 UserModel = get_user_model()
 
 
@@ -18,7 +20,10 @@ class EmailBackend(ModelBackend):
         except UserModel.DoesNotExist:
             return None
 
-        if user.check_password(password):
+        with PASSWORD_HASH_SECONDS.labels("check_password").time():
+            is_verified = user.check_password(password)
+
+        if is_verified:
             return user
 
         return None
@@ -0,0 +1,89 @@
+import time, threading, multiprocessing
+
+import django
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+
+from server.metrics import PASSWORD_HASH_SECONDS
+from .utils import encrypt_private_key_pem
+
+_hashing_pool = None
+_hashing_pool_lock = threading.Lock()
+
+
+def get_hashing_pool() -> ProcessPoolExecutor:
+    global _hashing_pool
+
+    with _hashing_pool_lock:
+        if _hashing_pool is None:
+            # spawn instead of fork, the worker may already be running threads
+            _hashing_pool = ProcessPoolExecutor(
+                max_workers=settings.PASSWORD_HASHING_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=django.setup,
+            )
+
+        return _hashing_pool
+
+
+def reset_hashing_pool():
+    global _hashing_pool
+
+    with _hashing_pool_lock:
+        if _hashing_pool is not None:
+            _hashing_pool.shutdown(wait=False, cancel_futures=True)
+            _hashing_pool = None
+
+
+def run_timed(func, *args):
+    # the pool processes time their own jobs, metrics recorded there would not
+    # reach the request's process
+    start = time.perf_counter()
+    result = func(*args)
+
+    return result, time.perf_counter() - start
+
+
+def hash_registration_secrets(
+    password: str, master_password: str, private_key_pem: bytes
+) -> tuple[str, str, bytes]:
+    """
+    Hash the password and master password and encrypt the private key with
+    the master password (PBKDF2). The three jobs run side by side on the
+    hashing process pool so they neither pin the request thread's GIL nor add
+    up; with PASSWORD_HASHING_WORKERS = 0 they run inline.
+    Returns (password hash, master password hash, encrypted private key).
+    """
+    results = None
+
+    if settings.PASSWORD_HASHING_WORKERS > 0:
+        try:
+            pool = get_hashing_pool()
+            jobs = [
+                pool.submit(run_timed, make_password, password),
+                pool.submit(run_timed, make_password, master_password),
+                pool.submit(
+                    run_timed, encrypt_private_key_pem, private_key_pem, master_password
+                ),
+            ]
+            results = [job.result() for job in jobs]
+        except BrokenProcessPool:
+            # a pool process died, start a fresh pool next time
+            reset_hashing_pool()
+
+    if results is None:
+        results = [
+            run_timed(make_password, password),
+            run_timed(make_password, master_password),
+            run_timed(encrypt_private_key_pem, private_key_pem, master_password),
+        ]
+
+    for operation, (_, seconds) in zip(
+        ["make_password", "make_password", "encrypt_private_key"], results
+    ):
+        PASSWORD_HASH_SECONDS.labels(operation).observe(seconds)
+
+    return tuple(result for result, _ in results)
@@ -0,0 +1,85 @@
+from django.db import connection, transaction
+
+from .models import PooledKeyPair
+from .utils import (
+    generate_rsa_key_pair,
+    serialize_rsa_key_pair,
+    encrypt_with_server_key,
+    decrypt_with_server_key,
+)
+
+
+def key_pool_depth() -> int:
+    return PooledKeyPair.objects.count()
+
+
+def fill_key_pool(target_size: int) -> int:
+    """
+    Generate key pairs until the pool holds `target_size` of them. Returns the
+    number of key pairs added.
+    """
+    added = 0
+
+    while key_pool_depth() < target_size:
+        private_key_pem, public_key_pem = serialize_rsa_key_pair(
+            *generate_rsa_key_pair()
+        )
+        PooledKeyPair.objects.create(
+            encrypted_private_key=encrypt_with_server_key(private_key_pem),
+            public_key=public_key_pem,
+        )
+        added += 1
+
+    return added
+
+
+def pop_key_pair() -> tuple[bytes, str] | None:
+    """
+    Take the oldest key pair out of the pool, as PEM encoded private and public
+    keys. Returns None when the pool is empty.
+    """
+    if connection.features.has_select_for_update_skip_locked:
+        # concurrent registrations each lock a different entry
+        with transaction.atomic():
+            entry = (
+                PooledKeyPair.objects.select_for_update(skip_locked=True)
+                .order_by("id")
+                .first()
+            )
+
+            if entry is None:
+                return None
+
+            entry.delete()
+
+        return decrypt_with_server_key(entry.encrypted_private_key), entry.public_key
+
+    for _ in range(3):
+        entry = PooledKeyPair.objects.order_by("id").first()
+
+        if entry is None:
+            return None
+
+        # another worker may have taken the same entry, only the delete decides
+        deleted, _ = PooledKeyPair.objects.filter(id=entry.id).delete()
+
+        if deleted:
+            return (
+                decrypt_with_server_key(entry.encrypted_private_key),
+                entry.public_key,
+            )
+
+    return None
+
+
+def get_rsa_key_pair_pem() -> tuple[bytes, str]:
+    """
+    PEM encoded key pair for a new user, from the pool when possible and
+    generated inline otherwise.
+    """
+    key_pair = pop_key_pair()
+
+    if key_pair is None:
+        key_pair = serialize_rsa_key_pair(*generate_rsa_key_pair())
+
+    return key_pair
@@ -0,0 +1,243 @@
+import json, pkgutil, platform, statistics, time
+from collections import defaultdict
+from contextlib import ExitStack
+from functools import wraps
+from unittest import mock
+
+import django
+import pyotp
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_databases, teardown_databases
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from auth_app.key_pool import fill_key_pool
+from auth_app.models import User
+from auth_app.throttling import CostBasedThrottle
+from auth_app.utils import decrypt_mfa_secret
+
+# (stage, module attribute wrapped with a timer)
+STAGE_TARGETS = [
+    ("hashing", "auth_app.serializers.hash_registration_secrets"),
+    ("hashing", "auth_app.serializers.check_password"),
+    ("hashing", "django.contrib.auth.base_user.check_password"),
+    ("keygen", "auth_app.serializers.get_rsa_key_pair_pem"),
+    ("qr", "auth_app.views.generate_qr_code_image_uri"),
+    ("jwt", "auth_app.views.generate_mfa_temp_token"),
+    ("jwt", "auth_app.views.decode_mfa_temp_token"),
+    ("jwt", "rest_framework_simplejwt.tokens.RefreshToken.for_user"),
+    ("jwt", "rest_framework_simplejwt.tokens.Token.__str__"),
+    ("jwt", "rest_framework_simplejwt.authentication.JWTAuthentication.authenticate"),
+]
+
+ENDPOINTS = ["register", "login", "mfa_confirm", "get_enc_private_key"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the register, login, MFA confirm and encrypted private key "
+        "endpoints against a throwaway test database. Reports p50/p95/p99 latency "
+        "with a per stage breakdown and writes the results as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--iterations", type=int, default=20, help="Sign-up flows to run."
+        )
+        parser.add_argument(
+            "--warmup", type=int, default=1, help="Flows run before measuring."
+        )
+        parser.add_argument(
+            "--key-pool",
+            type=int,
+            default=0,
+            help="Pre-generated key pairs to put in the pool before measuring.",
+        )
+        parser.add_argument(
+            "--output", default="bench-auth.json", help="File the JSON is written to."
+        )
+
+    def handle(self, *args, **options):
+        old_config = setup_databases(verbosity=0, interactive=False)
+        self.stages = defaultdict(float)
+        self.samples = {endpoint: [] for endpoint in ENDPOINTS}
+
+        try:
+            with ExitStack() as stack:
+                for stage, target in STAGE_TARGETS:
+                    stack.enter_context(self.timed(stage, target))
+
+                stack.enter_context(connection.execute_wrapper(self.time_query))
+                # every iteration comes from the same address
+                stack.enter_context(
+                    mock.patch.object(
+                        CostBasedThrottle, "allow_request", return_value=True
+                    )
+                )
+
+                if options["key_pool"]:
+                    fill_key_pool(options["key_pool"] + options["warmup"])
+
+                for i in range(options["warmup"]):
+                    self.run_flow(f"warmup{i}", record=False)
+
+                for i in range(options["iterations"]):
+                    self.run_flow(f"bench{i}", record=True)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+        results = {
+            "created_at": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "iterations": options["iterations"],
+            "config": {
+                "key_pool": options["key_pool"],
+                "password_hashing_workers": settings.PASSWORD_HASHING_WORKERS,
+                "totp_qr_image_format": settings.TOTP_QR_IMAGE_FORMAT,
+                "password_hasher": settings.PASSWORD_HASHERS[0],
+            },
+            "endpoints": {
+                endpoint: self.summarize(self.samples[endpoint])
+                for endpoint in ENDPOINTS
+            },
+        }
+
+        with open(options["output"], "w") as f:
+            json.dump(results, f, indent=2)
+
+        self.stdout.write(
+            f"{'endpoint':<20} {'p50':>9} {'p95':>9} {'p99':>9}  stages (mean ms)"
+        )
+
+        for endpoint, summary in results["endpoints"].items():
+            stages = ", ".join(
+                f"{stage} {ms:.1f}" for stage, ms in summary["stages_ms"].items()
+            )
+            self.stdout.write(
+                f"{endpoint:<20} {summary['p50_ms']:>9.1f} {summary['p95_ms']:>9.1f} "
+                f"{summary['p99_ms']:>9.1f}  {stages}"
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def timed(self, stage, target):
+        module_path, _, attribute = target.rpartition(".")
+        owner = pkgutil.resolve_name(module_path)
+        original = getattr(owner, attribute)
+
+        @wraps(original)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.stages[stage] += time.perf_counter() - start
+
+        return mock.patch.object(owner, attribute, wrapper)
+
+    def time_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.stages["db"] += time.perf_counter() - start
+
+    def request(self, endpoint, record, send):
+        self.stages.clear()
+        start = time.perf_counter()
+        response = send()
+        elapsed = time.perf_counter() - start
+
+        if response.status_code >= 400:
+            raise RuntimeError(f"{endpoint} failed: {response.content!r}")
+
+        if record:
+            stages = {stage: seconds * 1000 for stage, seconds in self.stages.items()}
+            stages["other"] = max(elapsed * 1000 - sum(stages.values()), 0)
+            self.samples[endpoint].append((elapsed * 1000, stages))
+
+        return response.data
+
+    def run_flow(self, name, record):
+        client = APIClient()
+        email = f"{name}@bench.local"
+        password = "Bench@123"
+        master_password = "Master@123"
+
+        self.request(
+            "register",
+            record,
+            lambda: client.post(
+                "/api/auth/register",
+                {
+                    "email": email,
+                    "username": f"{name}_user",
+                    "password": password,
+                    "master_password": master_password,
+                    "name": "Bench User",
+                },
+                format="json",
+            ),
+        )
+
+        # MFA is not set up yet, so login renders the TOTP QR code
+        data = self.request(
+            "login",
+            record,
+            lambda: client.post(
+                "/api/auth/login",
+                {"email": email, "password": password},
+                format="json",
+            ),
+        )
+
+        mfa_secret = decrypt_mfa_secret(User.objects.get(email=email).mfa_secret)
+        data = self.request(
+            "mfa_confirm",
+            record,
+            lambda: client.post(
+                "/api/auth/mfa/confirm",
+                {
+                    "mfa_temp_token": data["mfa_temp_token"],
+                    "totp_code": pyotp.TOTP(mfa_secret).now(),
+                },
+                format="json",
+            ),
+        )
+
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {data['access']}")
+        self.request(
+            "get_enc_private_key",
+            record,
+            lambda: client.post(
+                "/api/auth/get-enc-private-key",
+                {"master_password": master_password},
+                format="json",
+            ),
+        )
+
+    def summarize(self, samples):
+        latencies = [latency for latency, _ in samples]
+        cuts = (
+            statistics.quantiles(latencies, n=100, method="inclusive")
+            if len(latencies) > 1
+            else latencies * 99
+        )
+        stage_names = sorted({stage for _, stages in samples for stage in stages})
+
+        return {
+            "count": len(latencies),
+            "mean_ms": statistics.fmean(latencies),
+            "p50_ms": cuts[49],
+            "p95_ms": cuts[94],
+            "p99_ms": cuts[98],
+            "stages_ms": {
+                stage: statistics.fmean(stages.get(stage, 0) for _, stages in samples)
+                for stage in stage_names
+            },
+        }
@@ -0,0 +1,64 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from auth_app.key_pool import fill_key_pool, key_pool_depth
+
+
+class Command(BaseCommand):
+    help = (
+        "Top up the pool of pre-generated RSA key pairs used at registration. "
+        "With --watch it keeps running and refills the pool whenever it drops "
+        "below the low-water mark."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--target",
+            type=int,
+            default=settings.KEY_POOL_TARGET_SIZE,
+            help="Number of key pairs the pool is filled up to.",
+        )
+        parser.add_argument(
+            "--low-water",
+            type=int,
+            default=settings.KEY_POOL_LOW_WATER_MARK,
+            help="Pool depth below which a refill starts in --watch mode.",
+        )
+        parser.add_argument(
+            "--watch", action="store_true", help="Keep the pool filled."
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Seconds between pool depth checks in --watch mode.",
+        )
+        parser.add_argument(
+            "--status", action="store_true", help="Only print the pool depth."
+        )
+
+    def handle(self, *args, **options):
+        if options["status"]:
+            self.stdout.write(f"key_pool_depth {key_pool_depth()}")
+            return
+
+        if not options["watch"]:
+            added = fill_key_pool(options["target"])
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Added {added} key pairs, pool depth is {key_pool_depth()}."
+                )
+            )
+            return
+
+        while True:
+            depth = key_pool_depth()
+
+            if depth < options["low_water"]:
+                added = fill_key_pool(options["target"])
+                self.stdout.write(f"Pool depth was {depth}, added {added} key pairs.")
+                self.stdout.flush()
+
+            time.sleep(options["interval"])
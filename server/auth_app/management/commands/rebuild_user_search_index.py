@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from auth_app.search import is_search_index_enabled, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the SQLite full-text index used by the admin user search. "
+        "Run it after bulk user imports or updates that bypass model signals."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="Database alias to rebuild the index on.",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="Users inserted per batch."
+        )
+
+    def handle(self, *args, **options):
+        if not is_search_index_enabled(options["database"]):
+            self.stdout.write(
+                "The search index is only kept on SQLite, PostgreSQL searches the "
+                "user table through trigram indexes."
+            )
+            return
+
+        count = rebuild_search_index(options["database"], options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} users."))
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:26
+
+from django.db import migrations
+
+SEARCH_FIELDS = ["name", "username", "email"]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    if vendor == "sqlite":
+        # rowid is the user id, the prefix indexes speed up short "abc*" queries
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS auth_app_user_fts "
+            "USING fts5(name, username, email, prefix='2 3')"
+        )
+        schema_editor.execute(
+            "INSERT INTO auth_app_user_fts (rowid, name, username, email) "
+            "SELECT id, name, username, email FROM auth_app_user"
+        )
+    elif vendor == "postgresql":
+        # icontains compiles to UPPER(field) LIKE UPPER(%s)
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+        for field in SEARCH_FIELDS:
+            schema_editor.execute(
+                f"CREATE INDEX IF NOT EXISTS auth_app_user_{field}_trgm "
+                f"ON auth_app_user USING gin (UPPER({field}) gin_trgm_ops)"
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    if vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS auth_app_user_fts")
+    elif vendor == "postgresql":
+        for field in SEARCH_FIELDS:
+            schema_editor.execute(f"DROP INDEX IF EXISTS auth_app_user_{field}_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth_app", "0003_pooledkeypair"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -74,6 +74,12 @@ class User(AbstractUser):
 
     objects = UserManager()
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # keyset pagination of the admin user list
+            models.Index(fields=["date_joined", "id"], name="user_date_joined_id_idx"),
+        ]
+
     def is_admin(self):
         return self.role == "admin"
 
@@ -82,3 +88,14 @@ class User(AbstractUser):
 
     def is_guest(self):
         return self.role == "guest"
+
+
+class PooledKeyPair(models.Model):
+    """
+    RSA key pair generated ahead of time and handed out to a user at sign up.
+    The private key stays encrypted with the server key until then.
+    """
+
+    encrypted_private_key = models.TextField()
+    public_key = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
@@ -0,0 +1,63 @@
+import base64, hashlib, json, uuid
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+USER_COUNT_VERSION_KEY = "user_count:version"
+
+
+def encode_user_cursor(user):
+    position = json.dumps([user.date_joined.isoformat(), user.id])
+    return base64.urlsafe_b64encode(position.encode("utf-8")).decode("utf-8")
+
+
+def decode_user_cursor(cursor):
+    """
+    Return the (date_joined, id) position encoded in `cursor`.
+    Raises ValueError if the cursor was not issued by `encode_user_cursor`.
+    """
+
+    try:
+        date_joined, user_id = json.loads(base64.urlsafe_b64decode(cursor))
+        return datetime.fromisoformat(date_joined), int(user_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor.") from e
+
+
+def users_after_cursor(queryset, cursor):
+    # keyset on (date_joined, id). the redundant >= gives the planner a range
+    # to seek to on the (date_joined, id) index instead of scanning it
+    date_joined, user_id = decode_user_cursor(cursor)
+
+    return queryset.filter(
+        Q(date_joined__gte=date_joined),
+        Q(date_joined__gt=date_joined) | Q(id__gt=user_id),
+    )
+
+
+def get_user_count_version():
+    version = cache.get(USER_COUNT_VERSION_KEY)
+
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.set(USER_COUNT_VERSION_KEY, version, None)
+
+    return version
+
+
+def invalidate_user_counts():
+    cache.set(USER_COUNT_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def get_cached_user_count(queryset, search):
+    search_hash = hashlib.sha256((search or "").encode("utf-8")).hexdigest()
+    key = f"user_count:{get_user_count_version()}:{search_hash}"
+    count = cache.get(key)
+
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, settings.USER_COUNT_CACHE_TTL_IN_MINS * 60)
+
+    return count
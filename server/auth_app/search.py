@@ -0,0 +1,157 @@
+import re
+
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Greatest
+
+from .models import User
+
+# FTS5 table on SQLite, rowid is the user id
+USER_SEARCH_TABLE = "auth_app_user_fts"
+
+SEARCH_FIELDS = ["name", "username", "email"]
+
+# name matches rank above username matches, which rank above email matches
+BM25_WEIGHTS = "10.0, 5.0, 1.0"
+
+
+def get_search_terms(search):
+    # fts5 tokenizes on anything that is not a letter or a digit, do the same
+    # so "john.doe@ex" becomes the prefixes john* doe* ex*
+    return [term for term in re.split(r"[\W_]+", search.lower()) if term]
+
+
+def get_match_expression(terms):
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def search_users(queryset, search, ranked=True):
+    """
+    Filter `queryset` down to users whose name, username or email contains a
+    word starting with each term in `search`, ordered by relevance unless
+    `ranked` is False, in which case the queryset ordering is kept.
+    """
+
+    terms = get_search_terms(search)
+
+    # nothing to match on, e.g. a search for "@"
+    if not terms:
+        return queryset
+
+    vendor = connections[queryset.db].vendor
+
+    if vendor == "sqlite":
+        match = get_match_expression(terms)
+        queryset = queryset.filter(
+            id__in=RawSQL(
+                f"SELECT rowid FROM {USER_SEARCH_TABLE} "
+                f"WHERE {USER_SEARCH_TABLE} MATCH %s",
+                [match],
+            )
+        )
+
+        if not ranked:
+            return queryset
+
+        # bm25 is lower for better matches
+        return queryset.annotate(
+            search_rank=RawSQL(
+                f"SELECT bm25({USER_SEARCH_TABLE}, {BM25_WEIGHTS}) "
+                f"FROM {USER_SEARCH_TABLE} "
+                f"WHERE {USER_SEARCH_TABLE} MATCH %s "
+                f"AND rowid = {User._meta.db_table}.id",
+                [match],
+            )
+        ).order_by("search_rank", "date_joined", "id")
+
+    query = Q()
+
+    for term in terms:
+        query &= (
+            Q(name__icontains=term)
+            | Q(username__icontains=term)
+            | Q(email__icontains=term)
+        )
+
+    queryset = queryset.filter(query)
+
+    if not ranked:
+        return queryset
+
+    if vendor == "postgresql":
+        from django.contrib.postgres.search import TrigramWordSimilarity
+
+        # icontains is served by the trigram indexes on UPPER(field)
+        return queryset.annotate(
+            search_rank=Greatest(
+                *[
+                    TrigramWordSimilarity(search, field_name)
+                    for field_name in SEARCH_FIELDS
+                ]
+            )
+        ).order_by(F("search_rank").desc(), "date_joined", "id")
+
+    return queryset
+
+
+def is_search_index_enabled(using):
+    return connections[using].vendor == "sqlite"
+
+
+def index_user(user, using="default"):
+    if not is_search_index_enabled(using):
+        return
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {USER_SEARCH_TABLE} WHERE rowid = %s", [user.id])
+        cursor.execute(
+            f"INSERT INTO {USER_SEARCH_TABLE} (rowid, name, username, email) "
+            "VALUES (%s, %s, %s, %s)",
+            [user.id, user.name, user.username, user.email],
+        )
+
+
+def unindex_user(user_id, using="default"):
+    if not is_search_index_enabled(using):
+        return
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {USER_SEARCH_TABLE} WHERE rowid = %s", [user_id])
+
+
+def rebuild_search_index(using="default", batch_size=1000):
+    """
+    Recreate the search table contents from the user table. Needed after bulk
+    writes such as `bulk_create` or `update`, which do not send signals.
+    """
+
+    if not is_search_index_enabled(using):
+        return 0
+
+    count = 0
+
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {USER_SEARCH_TABLE}")
+        last_id = 0
+
+        while True:
+            rows = list(
+                User.objects.using(using)
+                .filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", "name", "username", "email")[:batch_size]
+            )
+
+            if not rows:
+                break
+
+            cursor.executemany(
+                f"INSERT INTO {USER_SEARCH_TABLE} (rowid, name, username, email) "
+                "VALUES (%s, %s, %s, %s)",
+                rows,
+            )
+            count += len(rows)
+            last_id = rows[-1][0]
+
+    return count
@@ -1,19 +1,16 @@
 import base64
 
 from rest_framework import serializers
-from cryptography.hazmat.primitives import serialization
 
-from django.contrib.auth.hashers import make_password, check_password
+from django.contrib.auth.hashers import check_password
 from django.contrib.auth import authenticate
 
+from server.metrics import PASSWORD_HASH_SECONDS
 from . import validators
 from .models import User
-from .utils import (
-    encrypt_mfa_secret,
-    generate_mfa_secret,
-    generate_rsa_key_pair,
-    encrypt_private_key,
-)
+from .key_pool import get_rsa_key_pair_pem
+from .hashing import hash_registration_secrets
+from .utils import encrypt_mfa_secret, generate_mfa_secret
 
 
 class UserRegisterSerializer(serializers.ModelSerializer):
@@ -49,23 +46,21 @@ class UserRegisterSerializer(serializers.ModelSerializer):
         mfa_secret = encrypt_mfa_secret(generate_mfa_secret())
         mfa_enabled = False
 
-        private_key, public_key = generate_rsa_key_pair()
-        enc_priv_key_binary = encrypt_private_key(private_key, master_password)
+        private_key_pem, public_key = get_rsa_key_pair_pem()
+        password_hash, master_password_hash, enc_priv_key_binary = (
+            hash_registration_secrets(password, master_password, private_key_pem)
+        )
         enc_priv_key = base64.b64encode(enc_priv_key_binary).decode("utf-8")
-        public_key = public_key.public_bytes(
-            encoding=serialization.Encoding.PEM,
-            format=serialization.PublicFormat.SubjectPublicKeyInfo,
-        ).decode("utf-8")
 
         user = User(
             name=name,
-            password=make_password(password),
+            password=password_hash,
             username=username,
             email=email,
             role=role,
             mfa_secret=mfa_secret,
             mfa_enabled=mfa_enabled,
-            master_password_hash=make_password(master_password),
+            master_password_hash=master_password_hash,
             encrypted_private_key=enc_priv_key,
             public_key=public_key,
         )
@@ -107,7 +102,9 @@ class GetEncPrivateKeySerializer(serializers.Serializer):
             raise serializers.ValidationError("User is not authenticated.")
 
         mp = attrs.get("master_password")
-        is_verified = check_password(mp, user.master_password_hash)
+
+        with PASSWORD_HASH_SECONDS.labels("check_password").time():
+            is_verified = check_password(mp, user.master_password_hash)
 
         if not is_verified:
             raise serializers.ValidationError("Invalid credential.")
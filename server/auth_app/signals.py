@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .pagination import invalidate_user_counts
+from .search import SEARCH_FIELDS, index_user, unindex_user
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def index_user_on_save(sender, instance, using, update_fields=None, **kwargs):
+    if update_fields is not None and not set(SEARCH_FIELDS) & set(update_fields):
+        return
+
+    index_user(instance, using=using)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def unindex_user_on_delete(sender, instance, using, **kwargs):
+    unindex_user(instance.id, using=using)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_counts_on_create(sender, created, **kwargs):
+    if created:
+        invalidate_user_counts()
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_counts_on_delete(sender, **kwargs):
+    invalidate_user_counts()
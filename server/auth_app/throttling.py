@@ -0,0 +1,130 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+
+def get_bucket_limits(kind):
+    """
+    Capacity and tokens regained a second of the "ip" or "user" buckets.
+    """
+    if kind == "user":
+        return (
+            settings.AUTH_THROTTLE_USER_BURST,
+            settings.AUTH_THROTTLE_USER_TOKENS_PER_MIN / 60,
+        )
+
+    return settings.AUTH_THROTTLE_BURST, settings.AUTH_THROTTLE_TOKENS_PER_MIN / 60
+
+
+def get_bucket_timeout(kind):
+    # buckets expire once they would be full again
+    burst, rate = get_bucket_limits(kind)
+
+    return int(burst / rate) + 1
+
+
+class CostBasedThrottle(BaseThrottle):
+    """
+    Token buckets in the default cache, one per client IP and one per user.
+    The IP bucket holds up to `AUTH_THROTTLE_BURST` tokens and regains
+    `AUTH_THROTTLE_TOKENS_PER_MIN` a minute, every request spends the
+    `throttle_cost` of its view, the work it makes the server do. The user
+    bucket counts attempts at the user's credentials, `throttle_user_cost`
+    (1 by default) out of `AUTH_THROTTLE_USER_BURST`, regaining
+    `AUTH_THROTTLE_USER_TOKENS_PER_MIN` a minute wherever they come from. A
+    request that one bucket cannot pay for is rejected without spending
+    anything, before the view does any work.
+
+    The user is the authenticated one, or whoever the view names through
+    `get_throttle_user(request)`, such as the account a login is attempted for.
+    The buckets charged are kept on the view so that it can give back part of
+    the cost through `refund_throttle_cost`.
+
+    The buckets are only shared by all processes when the default cache is,
+    see CACHE_REDIS_URL. Otherwise every worker allows the full rate.
+    """
+
+    def get_buckets(self, request, view):
+        buckets = {
+            "ip": (
+                f"throttle:ip:{self.get_ident(request)}",
+                getattr(view, "throttle_cost", 1),
+            )
+        }
+        user = None
+
+        if request.user and request.user.is_authenticated:
+            user = request.user.pk
+        elif hasattr(view, "get_throttle_user"):
+            user = view.get_throttle_user(request)
+
+        if user is not None:
+            buckets["user"] = (
+                f"throttle:user:{user}",
+                getattr(view, "throttle_user_cost", 1),
+            )
+
+        return buckets
+
+    def allow_request(self, request, view):
+        now = time.time()
+
+        buckets = self.get_buckets(request, view)
+        stored = cache.get_many([key for key, _ in buckets.values()])
+        self.wait_seconds = 0
+        spent = {}
+
+        for kind, (key, cost) in buckets.items():
+            burst, rate = get_bucket_limits(kind)
+            # a missing bucket is a full one
+            tokens, updated_at = stored.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+
+            if tokens < cost:
+                self.wait_seconds = max(self.wait_seconds, (cost - tokens) / rate)
+
+            spent[kind] = (key, (tokens - cost, now))
+
+        if self.wait_seconds:
+            return False
+
+        # like DRF's own throttles this is not atomic, concurrent requests may
+        # both spend the same tokens
+        for kind, (key, bucket) in spent.items():
+            cache.set(key, bucket, timeout=get_bucket_timeout(kind))
+
+        view.throttle_charged_keys = {kind: key for kind, (key, _) in spent.items()}
+
+        return True
+
+    def wait(self):
+        return self.wait_seconds
+
+
+def refund_throttle_cost(view, tokens, user_tokens=0):
+    """
+    Give `tokens` back to the IP bucket and `user_tokens` to the user bucket
+    charged for the request `view` handles, for requests that did not do the
+    work or make the attempt their cost stands for.
+    """
+    keys = getattr(view, "throttle_charged_keys", None) or {}
+    refunds = {"ip": tokens, "user": user_tokens}
+
+    for kind, key in keys.items():
+        if refunds[kind] <= 0:
+            continue
+
+        bucket = cache.get(key)
+
+        if bucket is None:
+            continue
+
+        burst, _ = get_bucket_limits(kind)
+        bucket_tokens, updated_at = bucket
+        cache.set(
+            key,
+            (min(burst, bucket_tokens + refunds[kind]), updated_at),
+            timeout=get_bucket_timeout(kind),
+        )
@@ -1,8 +1,9 @@
-import pyotp, qrcode, base64, os, jwt
+import pyotp, base64, os, jwt, hashlib
 from io import BytesIO
 
 from django.utils import timezone
 from django.conf import settings
+from django.core.cache import caches
 
 from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.primitives.asymmetric import rsa
@@ -28,12 +29,29 @@ def derive_key_from_master_password(master_password, salt):
     return kdf.derive(master_password.encode("utf-8"))
 
 
+def serialize_rsa_key_pair(private_key, public_key) -> tuple[bytes, str]:
+    private_key_pem = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+    public_key_pem = public_key.public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo,
+    ).decode("utf-8")
+    return private_key_pem, public_key_pem
+
+
 def encrypt_private_key(private_key, master_password):
     pem = private_key.private_bytes(
         encoding=serialization.Encoding.PEM,
         format=serialization.PrivateFormat.PKCS8,
         encryption_algorithm=serialization.NoEncryption(),
     )
+    return encrypt_private_key_pem(pem, master_password)
+
+
+def encrypt_private_key_pem(pem, master_password):
     salt = os.urandom(16)
     derived_key = derive_key_from_master_password(master_password, salt)
     aesgcm = AESGCM(derived_key)
@@ -53,6 +71,18 @@ def decrypt_private_key(encrypted_private_key, master_password):
     return private_key
 
 
+def encrypt_with_server_key(data: bytes) -> str:
+    aesgcm = AESGCM(get_server_key())
+    nonce = os.urandom(12)
+    return base64.b64encode(nonce + aesgcm.encrypt(nonce, data, None)).decode("utf-8")
+
+
+def decrypt_with_server_key(encrypted_data: str) -> bytes:
+    data = base64.b64decode(encrypted_data)
+    aesgcm = AESGCM(get_server_key())
+    return aesgcm.decrypt(data[:12], data[12:], None)
+
+
 def generate_mfa_secret():
     return pyotp.random_base32()
 
@@ -89,12 +119,42 @@ def generate_totp_uri(secret, email, issuer="FShare"):
     return f"otpauth://totp/{issuer}:{email}?secret={secret}&issuer={issuer}"
 
 
-def generate_qr_code_image_uri(totp_uri: str) -> str:
-    img = qrcode.make(totp_uri)
+def render_qr_code_image_uri(totp_uri: str, image_format: str) -> str:
+    # imported lazily, qrcode pulls in Pillow which most workers never need
+    import qrcode
+
     buffered = BytesIO()
-    img.save(buffered, format="PNG")
+
+    if image_format == "svg":
+        from qrcode.image.svg import SvgPathImage
+
+        qrcode.make(totp_uri, image_factory=SvgPathImage).save(buffered)
+        mimetype = "image/svg+xml"
+    else:
+        qrcode.make(totp_uri).save(buffered, format="PNG")
+        mimetype = "image/png"
+
     img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
-    return f"data:image/png;base64,{img_str}"
+    return f"data:{mimetype};base64,{img_str}"
+
+
+def generate_qr_code_image_uri(totp_uri: str, image_format: str = None) -> str:
+    """
+    QR code of `totp_uri` as a data URI. The rendered image is cached under a
+    digest of the URI so the secret it contains is never part of a cache key.
+    """
+    image_format = image_format or settings.TOTP_QR_IMAGE_FORMAT
+    digest = hashlib.sha256(totp_uri.encode("utf-8")).hexdigest()
+    cache_key = f"totp_qr:{image_format}:{digest}"
+    qr_cache = caches["totp_qr"]
+
+    image_uri = qr_cache.get(cache_key)
+
+    if image_uri is None:
+        image_uri = render_qr_code_image_uri(totp_uri, image_format)
+        qr_cache.set(cache_key, image_uri)
+
+    return image_uri
 
 
 def encrypt_mfa_secret(mfa_secret: str) -> str:
@@ -1,7 +1,5 @@
 import jwt, traceback
 
-from django.db.models import Q
-
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
@@ -16,6 +14,13 @@ from .serializers import (
     AdminUpdateUserSerializer,
 )
 from .permissions import IsActive, IsAdmin
+from .throttling import CostBasedThrottle, refund_throttle_cost
+from .search import search_users
+from .pagination import (
+    encode_user_cursor,
+    users_after_cursor,
+    get_cached_user_count,
+)
 from .utils import (
     decode_mfa_temp_token,
     generate_mfa_temp_token,
@@ -31,6 +36,9 @@ from .utils import (
 
 class RegisterView(APIView):
     permission_classes = []
+    # RSA key pair, two password hashes and the private key encryption key
+    throttle_classes = [CostBasedThrottle]
+    throttle_cost = 10
 
     def post(self, request):
         try:
@@ -55,6 +63,9 @@ class RegisterView(APIView):
                     status=status.HTTP_201_CREATED,
                 )
 
+            # nothing was generated or hashed for an invalid registration
+            refund_throttle_cost(self, self.throttle_cost - 1)
+
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             traceback.print_exc()
@@ -66,14 +77,36 @@ class RegisterView(APIView):
 
 class LoginView(APIView):
     permission_classes = []
+    throttle_classes = [CostBasedThrottle]
+    throttle_cost = 3
+    throttle_user_cost = 1
+
+    def get_throttle_user(self, request):
+        # guessing the password of one account from many addresses
+        email = request.data.get("email") if hasattr(request.data, "get") else None
+
+        if not email:
+            return None
+
+        return f"email:{str(email).strip().lower()}"
 
     def post(self, request):
         try:
             serializer = LoginSerializer(data=request.data)
 
             if not serializer.is_valid():
+                # field errors are raised before the password is checked
+                if "non_field_errors" not in serializer.errors:
+                    refund_throttle_cost(
+                        self, self.throttle_cost - 1, self.throttle_user_cost
+                    )
+
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+            # only failed attempts count against the account, so that its owner
+            # keeps logging in while nobody is guessing
+            refund_throttle_cost(self, 0, self.throttle_user_cost)
+
             user = serializer.validated_data["user"]
             mfa_secret = user.mfa_secret
             decrypted_mfa_secret = ""
@@ -81,7 +114,8 @@ class LoginView(APIView):
             if not mfa_secret:
                 decrypted_mfa_secret = generate_mfa_secret()
                 user.mfa_secret = encrypt_mfa_secret(decrypted_mfa_secret)
-                user.save()
+                # cached shares of the user's files do not depend on it
+                user.save(update_fields=["mfa_secret"])
 
             if user.mfa_enabled:
                 mfa_temp_token, token_exp_at = generate_mfa_temp_token(user.id)
@@ -128,6 +162,18 @@ then normal access and refresh tokens are issued
 
 class MFAConfirmView(APIView):
     permission_classes = []
+    throttle_classes = [CostBasedThrottle]
+    throttle_cost = 2
+    throttle_user_cost = 1
+
+    def get_throttle_user(self, request):
+        # guessing the TOTP code of one account from many addresses
+        try:
+            return decode_mfa_temp_token(request.data.get("mfa_temp_token")).get(
+                "user_id"
+            )
+        except Exception:
+            return None
 
     def post(self, request):
         try:
@@ -165,9 +211,11 @@ class MFAConfirmView(APIView):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
+            refund_throttle_cost(self, 0, self.throttle_user_cost)
+
             if not user.mfa_enabled:
                 user.mfa_enabled = True
-                user.save()
+                user.save(update_fields=["mfa_enabled"])
 
             refresh = RefreshToken.for_user(user)
 
@@ -190,6 +238,7 @@ class MFAConfirmView(APIView):
 
 class GetUserView(APIView):
     permission_classes = [IsActive]
+    read_replica = True
 
     def get(self, request):
         return Response(
@@ -200,6 +249,9 @@ class GetUserView(APIView):
 
 class GetEncPrivateKey(APIView):
     permission_classes = [IsActive]
+    throttle_classes = [CostBasedThrottle]
+    throttle_cost = 3
+    throttle_user_cost = 1
 
     def post(self, request):
         try:
@@ -208,8 +260,16 @@ class GetEncPrivateKey(APIView):
             )
 
             if not serializer.is_valid():
+                # field errors are raised before the master password is checked
+                if "non_field_errors" not in serializer.errors:
+                    refund_throttle_cost(
+                        self, self.throttle_cost - 1, self.throttle_user_cost
+                    )
+
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+            refund_throttle_cost(self, 0, self.throttle_user_cost)
+
             return Response(
                 {
                     "message": "Master password validated successfully.",
@@ -227,30 +287,70 @@ class GetEncPrivateKey(APIView):
 
 class GetUsers(APIView):
     permission_classes = [IsAdmin]
+    read_replica = True
 
     def get(self, request):
         try:
             search = request.query_params.get("q", None)
-            offset = int(request.query_params.get("page", "1")) - 1
+            cursor = request.query_params.get("cursor", None)
             limit = 10
 
-            if offset < 0:
+            users = User.objects.order_by("date_joined", "id")
+            matching_users = (
+                search_users(users, search, ranked=False) if search else users
+            )
+
+            # keyset pagination, every page costs the same as the first
+            if cursor is not None:
+                total_count = get_cached_user_count(matching_users, search)
+                users = matching_users
+
+                if cursor:
+                    try:
+                        users = users_after_cursor(users, cursor)
+                    except ValueError:
+                        return Response(
+                            {"message": "Invalid cursor value"},
+                            status=status.HTTP_400_BAD_REQUEST,
+                        )
+
+                # one extra row tells whether there is a next page
+                paginated_users = list(users[: limit + 1])
+                next_cursor = None
+
+                if len(paginated_users) > limit:
+                    paginated_users = paginated_users[:limit]
+                    next_cursor = encode_user_cursor(paginated_users[-1])
+
+                serializer = UserSerializer(paginated_users, many=True)
+
+                return Response(
+                    {
+                        "results": serializer.data,
+                        "page_info": {
+                            "total": total_count,
+                            "limit": limit,
+                            "fetched": len(serializer.data),
+                            "next_cursor": next_cursor,
+                        },
+                    },
+                    status=status.HTTP_200_OK,
+                )
+
+            page = int(request.query_params.get("page", "1"))
+
+            if page < 1:
                 return Response(
                     {"message": "Invalid curr_page value"},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            query = Q()
+            offset = (page - 1) * limit
+            total_count = get_cached_user_count(matching_users, search)
 
             if search:
-                query = (
-                    Q(name__icontains=search)
-                    | Q(username__icontains=search)
-                    | Q(email__icontains=search)
-                )
+                users = search_users(users, search)
 
-            users = User.objects.filter(query).order_by("date_joined")
-            total_count = users.count()
             paginated_users = users[offset : offset + limit]
 
             serializer = UserSerializer(paginated_users, many=True)
@@ -10,6 +10,16 @@ class FileShareAdmin(admin.ModelAdmin):
     readonly_fields = ["id", "encrypted_file_key"]
 
 
+class UploadSessionAdmin(admin.ModelAdmin):
+    readonly_fields = ["id"]
+
+
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    readonly_fields = ["id", "key_hash"]
+
+
 # Register your models here.
 admin.site.register(models.File, FileAdmin)
 admin.site.register(models.FileShare, FileShareAdmin)
+admin.site.register(models.UploadSession, UploadSessionAdmin)
+admin.site.register(models.IdempotencyKey, IdempotencyKeyAdmin)
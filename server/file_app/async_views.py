@@ -0,0 +1,175 @@
+import uuid, traceback
+
+from asgiref.sync import sync_to_async
+
+from rest_framework.response import Response
+from rest_framework import status
+
+from server.async_api import AsyncAPIView, stream_in_thread
+from server.metrics import FILE_UPLOAD_BYTES
+from .serializers import FileUploadSerializer
+from .idempotency import (
+    IDEMPOTENCY_KEY_MAX_LENGTH,
+    IdempotencyKeyInUse,
+    IdempotencyKeyMismatch,
+    fingerprint_request,
+    reserve_idempotency_key,
+    complete_idempotency_key,
+    release_idempotency_key,
+)
+from .share_access import aget_share_access
+from .storage import get_blob_storage
+from .views import (
+    FileUploadView,
+    SharedFileAccessView,
+    create_file_with_shares,
+    record_download,
+    store_blob,
+)
+
+"""
+async variants of the file transfer views, served when ASYNC_FILE_VIEWS is set,
+which `server/asgi.py` does by default. database work that needs a transaction
+runs on the request's thread through `sync_to_async`, blob reads, writes and
+encryption run on the default executor so they do not hold that thread
+"""
+
+
+def run_in_thread(func):
+    # for blocking work that makes no queries, which would otherwise leave a
+    # database connection open on an executor thread
+    return sync_to_async(func, thread_sensitive=False)
+
+
+class AsyncFileUploadView(AsyncAPIView, FileUploadView):
+    async def post(self, request):
+        idempotency_key = request.headers.get("Idempotency-Key")
+
+        if idempotency_key is None:
+            return await self.upload(request)
+
+        if not idempotency_key or len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return Response(
+                {"message": "Invalid Idempotency-Key header."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # parsing the body for the fingerprint only spools the file part
+        request_hash = await run_in_thread(fingerprint_request)(request)
+
+        try:
+            record, created = await sync_to_async(reserve_idempotency_key)(
+                request.user, idempotency_key, request_hash
+            )
+        except IdempotencyKeyInUse:
+            return Response(
+                {"message": "A request with this Idempotency-Key is in progress."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        except IdempotencyKeyMismatch:
+            return Response(
+                {"message": "This Idempotency-Key was used for a different request."},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+
+        if not created:
+            response = Response(record.response_body, status=record.response_status)
+            response["Idempotent-Replayed"] = "true"
+
+            return response
+
+        try:
+            response = await self.upload(request)
+        except BaseException:
+            await sync_to_async(release_idempotency_key)(record)
+            raise
+
+        await sync_to_async(complete_idempotency_key)(record, response)
+
+        return response
+
+    async def upload(self, request):
+        unique_filename = None
+
+        try:
+            # the body was already received by the ASGI handler, parsing it
+            # only spools the file part
+            serializer = FileUploadSerializer(
+                data=await run_in_thread(lambda: request.data)()
+            )
+
+            if not await run_in_thread(serializer.is_valid)():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+            if request.user.role == "guest":
+                return Response(
+                    {"message": "Guest users cannot upload files"},
+                    status=status.HTTP_403_FORBIDDEN,
+                )
+
+            uploaded_file = serializer.validated_data["file"]
+            encryption_key_b64 = serializer.validated_data["encryption_key_b64"]
+            file_metadata = serializer.validated_data["file_metadata"]
+            recipients_data = serializer.validated_data.get("recipients", [])
+
+            unique_filename = f"{uuid.uuid4().hex}.enc"
+            encryption_scheme = await run_in_thread(store_blob)(
+                unique_filename, uploaded_file
+            )
+
+            # the async ORM has no transactions yet
+            token, token_exp_at = await sync_to_async(create_file_with_shares)(
+                request.user,
+                unique_filename,
+                file_metadata,
+                encryption_key_b64,
+                recipients_data,
+                encryption_scheme,
+            )
+            FILE_UPLOAD_BYTES.observe(uploaded_file.size)
+
+            return Response(
+                {
+                    "message": "File uploaded and shares created successfully.",
+                    "share_token": token,
+                    "token_exp_at": token_exp_at,
+                },
+                status=status.HTTP_201_CREATED,
+            )
+        except Exception as e:
+            traceback.print_exc()
+
+            if unique_filename is not None:
+                await run_in_thread(get_blob_storage().delete)(unique_filename)
+
+            return Response(
+                {"message": "Something went wrong.", "stack": str(e)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+
+class AsyncSharedFileAccessView(AsyncAPIView, SharedFileAccessView):
+    async def get(self, request, token):
+        try:
+            file_id, error = self.decode_token(token)
+
+            if error is not None:
+                return error
+
+            share = await aget_share_access(file_id, request.user)
+            error = self.check_share(share)
+
+            if error is not None:
+                return error
+
+            # the response is prepared on a thread, its body is then streamed
+            # from the event loop without holding one for the transfer
+            response = await run_in_thread(self.respond)(request, share)
+
+            return stream_in_thread(record_download(response))
+        except Exception as e:
+            traceback.print_exc()
+            return Response(
+                {"message": "Something went wrong.", "stack": str(e)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
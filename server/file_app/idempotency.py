@@ -0,0 +1,134 @@
+import json, hashlib
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+
+class IdempotencyKeyInUse(Exception):
+    """
+    The first request with the key has not finished yet.
+    """
+
+
+class IdempotencyKeyMismatch(Exception):
+    """
+    The key was claimed by a request different from the one reusing it.
+    """
+
+
+def hash_idempotency_key(key: str) -> bytes:
+    return hashlib.sha256(key.encode("utf-8")).digest()
+
+
+def fingerprint_request(request) -> bytes:
+    """
+    sha256 of the method, path, Content-Length and form fields of `request`.
+    Uploaded files count with their name and size, their content is covered by
+    the hash in the file metadata.
+    """
+    digest = hashlib.sha256()
+    digest.update(
+        json.dumps(
+            [request.method, request.path, request.headers.get("Content-Length")]
+        ).encode("utf-8")
+    )
+
+    data = request.data
+    fields = data.lists() if hasattr(data, "lists") else data.items()
+
+    for name, values in sorted(fields, key=lambda field: field[0]):
+        if not isinstance(values, list):
+            values = [values]
+
+        values = [
+            [value.name, value.size] if isinstance(value, UploadedFile) else value
+            for value in values
+        ]
+        digest.update(json.dumps([name, values], default=str).encode("utf-8"))
+
+    return digest.digest()
+
+
+def reserve_idempotency_key(
+    user, key: str, request_hash: bytes
+) -> tuple[IdempotencyKey, bool]:
+    """
+    Claim `key` for a request of `user`, fingerprinted by `request_hash`.
+    Returns the record and whether it was created by this call. A record that
+    was not created holds the response to replay. Raises `IdempotencyKeyInUse`
+    while another request holds the key, and `IdempotencyKeyMismatch` when it
+    was claimed by a different request.
+    """
+    key_hash = hash_idempotency_key(key)
+    now = timezone.now()
+
+    for _ in range(3):
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    user=user,
+                    key_hash=key_hash,
+                    request_hash=request_hash,
+                    expires_at=now
+                    + timezone.timedelta(minutes=settings.IDEMPOTENCY_KEY_TTL_IN_MINS),
+                )
+
+            return record, True
+        except IntegrityError:
+            pass
+
+        record = IdempotencyKey.objects.filter(user=user, key_hash=key_hash).first()
+
+        # deleted by the request holding it in the meantime, try again
+        if record is None:
+            continue
+
+        lock_expired = record.created_at < now - timezone.timedelta(
+            minutes=settings.IDEMPOTENCY_KEY_LOCK_TIMEOUT_IN_MINS
+        )
+
+        if record.expires_at <= now or (
+            record.response_status is None and lock_expired
+        ):
+            # only one of the retries racing for a stale key gets to delete it
+            IdempotencyKey.objects.filter(id=record.id).delete()
+            continue
+
+        # keys claimed before requests were fingerprinted have no hash
+        if (
+            record.request_hash is not None
+            and bytes(record.request_hash) != request_hash
+        ):
+            raise IdempotencyKeyMismatch()
+
+        if record.response_status is None:
+            raise IdempotencyKeyInUse()
+
+        return record, False
+
+    raise IdempotencyKeyInUse()
+
+
+def complete_idempotency_key(record: IdempotencyKey, response) -> None:
+    """
+    Store the response of the request holding `record` for replay, unless it
+    failed, in which case the key is released so the client can try again.
+    """
+    if not status.is_success(response.status_code):
+        release_idempotency_key(record)
+        return
+
+    IdempotencyKey.objects.filter(id=record.id).update(
+        response_status=response.status_code, response_body=response.data
+    )
+
+
+def release_idempotency_key(record: IdempotencyKey) -> None:
+    IdempotencyKey.objects.filter(id=record.id).delete()
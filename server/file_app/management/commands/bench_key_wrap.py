@@ -0,0 +1,105 @@
+import statistics, time
+
+from cryptography.hazmat.primitives import serialization
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings, setup_databases, teardown_databases
+
+from auth_app.models import User
+from auth_app.utils import generate_rsa_key_pair
+from file_app.utils import public_key_cache
+from file_app.views import create_file_with_shares
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark share creation latency against the number of recipients with "
+        "serial and parallel key wrapping. Runs against a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--counts",
+            default="1,10,50,100,250,500",
+            help="Comma separated recipient counts.",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=5, help="Runs per recipient count."
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.KEY_WRAP_WORKERS,
+            help="Threads used in parallel mode.",
+        )
+
+    def handle(self, *args, **options):
+        counts = [int(count) for count in options["counts"].split(",")]
+        old_config = setup_databases(verbosity=0, interactive=False)
+
+        try:
+            # every recipient gets the same key, the cache is keyed by user anyway
+            _, public_key = generate_rsa_key_pair()
+            public_key = public_key.public_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PublicFormat.SubjectPublicKeyInfo,
+            ).decode("utf-8")
+
+            owner = User.objects.create_user(
+                email="owner@bench.local",
+                username="bench_owner",
+                name="Bench Owner",
+                public_key=public_key,
+            )
+            User.objects.bulk_create(
+                [
+                    User(
+                        email=f"recipient{i}@bench.local",
+                        username=f"bench_recipient_{i}",
+                        name="Bench Recipient",
+                        public_key=public_key,
+                    )
+                    for i in range(max(counts))
+                ]
+            )
+
+            self.stdout.write(
+                f"{'recipients':>10} {'serial ms':>10} {'parallel ms':>12} {'speedup':>8}"
+            )
+
+            for count in counts:
+                recipients = [
+                    {
+                        "email": f"recipient{i}@bench.local",
+                        "can_view": True,
+                        "can_download": False,
+                    }
+                    for i in range(count)
+                ]
+
+                serial = self.measure(owner, recipients, 1, options["repeat"])
+                parallel = self.measure(
+                    owner, recipients, options["workers"], options["repeat"]
+                )
+
+                self.stdout.write(
+                    f"{count:>10} {serial:>10.2f} {parallel:>12.2f} {serial / parallel:>7.2f}x"
+                )
+
+            self.stdout.write(f"public key cache: {public_key_cache.stats()}")
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+    def measure(self, owner, recipients, workers, repeat):
+        timings = []
+
+        with override_settings(KEY_WRAP_WORKERS=workers, KEY_WRAP_PARALLEL_THRESHOLD=0):
+            # warm up the public key cache and the thread pool
+            create_file_with_shares(owner, "bench.enc", {}, b"k" * 32, recipients)
+
+            for _ in range(repeat):
+                start = time.perf_counter()
+                create_file_with_shares(owner, "bench.enc", {}, b"k" * 32, recipients)
+                timings.append((time.perf_counter() - start) * 1000)
+
+        return statistics.median(timings)
@@ -0,0 +1,371 @@
+import asyncio, json, logging, multiprocessing, os, shutil, socket, statistics, tempfile, time
+
+import django
+from cryptography.hazmat.primitives import serialization
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from .stress_uploads import use_database
+
+
+def run_server(interface, db_name, db_options, media_root, port, timeout):
+    # the ASGI entrypoint serves the async file views, the WSGI one the sync ones
+    os.environ["ASYNC_FILE_VIEWS"] = "True" if interface == "asgi" else "False"
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "server.settings")
+    django.setup()
+
+    logging.getLogger("django.request").setLevel(logging.CRITICAL)
+    # connections of every thread share this settings dict
+    use_database(db_name, db_options)
+    settings.MEDIA_ROOT = media_root
+    settings.ALLOWED_HOSTS = ["127.0.0.1"]
+
+    if interface == "asgi":
+        import uvicorn
+        from django.core.asgi import get_asgi_application
+
+        uvicorn.run(
+            get_asgi_application(),
+            host="127.0.0.1",
+            port=port,
+            lifespan="off",
+            log_level="warning",
+        )
+        return
+
+    from django.core.wsgi import get_wsgi_application
+    from gunicorn.app.base import BaseApplication
+
+    class Application(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"127.0.0.1:{port}")
+            self.cfg.set("workers", 1)
+            self.cfg.set("worker_class", "sync")
+            # a transfer that outlives the timeout gets its worker killed
+            self.cfg.set("timeout", timeout)
+            self.cfg.set("loglevel", "warning")
+
+        def load(self):
+            return get_wsgi_application()
+
+    Application().run()
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+
+    raise CommandError(f"The server on port {port} did not start.")
+
+
+async def slow_download(port, path, access_token, rate, chunk_size, timeout):
+    """
+    Download `path` reading at most `rate` bytes per second, through a small
+    receive buffer so the server feels the back pressure of a slow client.
+    Returns the status code, time to first byte and time to last byte.
+    """
+    loop = asyncio.get_running_loop()
+    sock = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, chunk_size)
+    sock.setblocking(False)
+    start = time.perf_counter()
+    writer = None
+
+    try:
+        async with asyncio.timeout(timeout):
+            await loop.sock_connect(sock, ("127.0.0.1", port))
+            reader, writer = await asyncio.open_connection(sock=sock, limit=chunk_size)
+            writer.write(
+                (
+                    f"GET {path} HTTP/1.1\r\n"
+                    "Host: 127.0.0.1\r\n"
+                    f"Authorization: Bearer {access_token}\r\n"
+                    "Connection: close\r\n\r\n"
+                ).encode("utf-8")
+            )
+            await writer.drain()
+
+            data = await reader.read(chunk_size)
+            first_byte = time.perf_counter() - start
+            status_code = int(data.split(b" ", 2)[1]) if data else 0
+
+            while data:
+                await asyncio.sleep(len(data) / rate)
+                data = await reader.read(chunk_size)
+
+            return status_code, first_byte, time.perf_counter() - start
+    except (TimeoutError, OSError):
+        return None, None, time.perf_counter() - start
+    finally:
+        if writer is not None:
+            writer.close()
+        else:
+            sock.close()
+
+
+async def run_clients(port, path, access_token, options):
+    return await asyncio.gather(
+        *[
+            slow_download(
+                port,
+                path,
+                access_token,
+                options["rate"],
+                options["chunk_size"],
+                options["timeout"],
+            )
+            for _ in range(options["clients"])
+        ]
+    )
+
+
+def percentile(values, n):
+    if not values:
+        return 0
+
+    if len(values) == 1:
+        return values[0]
+
+    return statistics.quantiles(values, n=100, method="inclusive")[n - 1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Download a shared file from many slow clients at once, from a gunicorn "
+        "sync worker (WSGI) and from a uvicorn process (ASGI) serving a throwaway "
+        "SQLite database, and report how many transfers each completed. Needs "
+        "uvicorn for the ASGI run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interface",
+            choices=["wsgi", "asgi", "both"],
+            default="both",
+            help="Servers to benchmark.",
+        )
+        parser.add_argument(
+            "--clients", type=int, default=100, help="Concurrent downloads."
+        )
+        parser.add_argument(
+            "--size", type=int, default=512 * 1024, help="File size in bytes."
+        )
+        parser.add_argument(
+            "--rate",
+            type=int,
+            default=128 * 1024,
+            help="Bytes per second read by each client.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=16 * 1024,
+            help="Bytes read at a time, and the receive buffer of each client.",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=int,
+            default=60,
+            help="Seconds after which a download is given up.",
+        )
+        parser.add_argument(
+            "--scheme",
+            choices=["aesgcm_stream", "none"],
+            default="aesgcm_stream",
+            help="Server side encryption of the shared file.",
+        )
+        parser.add_argument(
+            "--output", help="Also write the results as JSON to this file."
+        )
+
+    def handle(self, *args, **options):
+        connection = connections["default"]
+
+        if connection.vendor != "sqlite":
+            raise CommandError("The default database is not SQLite.")
+
+        interfaces = (
+            ["wsgi", "asgi"]
+            if options["interface"] == "both"
+            else [options["interface"]]
+        )
+
+        if "asgi" in interfaces:
+            try:
+                import uvicorn  # noqa: F401
+            except ImportError:
+                raise CommandError(
+                    "The ASGI run requires uvicorn, pip install uvicorn."
+                )
+
+        original = {
+            "NAME": connection.settings_dict["NAME"],
+            "OPTIONS": connection.settings_dict.get("OPTIONS", {}),
+        }
+        original_media_root = settings.MEDIA_ROOT
+        original_scheme = settings.FILE_STORAGE_ENCRYPTION_SCHEME
+        tmp_dir = tempfile.mkdtemp(prefix="bench_transfers_")
+        results = {}
+
+        try:
+            db_name = os.path.join(tmp_dir, "db.sqlite3")
+            media_root = os.path.join(tmp_dir, "media")
+            os.makedirs(media_root)
+
+            use_database(db_name, original["OPTIONS"])
+            settings.MEDIA_ROOT = media_root
+            settings.FILE_STORAGE_ENCRYPTION_SCHEME = options["scheme"]
+            call_command("migrate", verbosity=0)
+
+            path, access_token = self.create_share(options["size"])
+            connections.close_all()
+
+            self.stdout.write(
+                f"{options['clients']} clients downloading {options['size']} bytes "
+                f"at {options['rate']} bytes/s each"
+            )
+            self.stdout.write(
+                f"{'server':<8} {'done':>6} {'failed':>7} {'wall s':>8} "
+                f"{'ttfb p50':>9} {'ttfb p95':>9} {'total p50':>10} {'total p95':>10}"
+            )
+
+            for interface in interfaces:
+                results[interface] = self.run_interface(
+                    interface,
+                    db_name,
+                    original["OPTIONS"],
+                    media_root,
+                    path,
+                    access_token,
+                    options,
+                )
+        finally:
+            connections["default"].close()
+            connection.settings_dict.update(original)
+            settings.MEDIA_ROOT = original_media_root
+            settings.FILE_STORAGE_ENCRYPTION_SCHEME = original_scheme
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+
+    def create_share(self, size):
+        from rest_framework_simplejwt.tokens import RefreshToken
+
+        from auth_app.models import User
+        from auth_app.utils import generate_rsa_key_pair
+        from file_app.views import create_file_with_shares, store_blob
+
+        _, public_key = generate_rsa_key_pair()
+        public_key = public_key.public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo,
+        ).decode("utf-8")
+
+        owner = User.objects.create_user(
+            email="owner@bench.local",
+            username="bench_owner",
+            name="Bench Owner",
+            public_key=public_key,
+        )
+        User.objects.create_user(
+            email="recipient@bench.local",
+            username="bench_recipient",
+            name="Bench Recipient",
+            public_key=public_key,
+        )
+
+        unique_filename = "bench.enc"
+        encryption_scheme = store_blob(
+            unique_filename, SimpleUploadedFile(unique_filename, os.urandom(size))
+        )
+        token, _ = create_file_with_shares(
+            owner,
+            unique_filename,
+            {
+                "name": "bench.png",
+                "mimetype": "image/png",
+                "size": size,
+                "hash": "bench",
+            },
+            os.urandom(32),
+            [
+                {
+                    "email": "recipient@bench.local",
+                    "can_view": True,
+                    "can_download": True,
+                }
+            ],
+            encryption_scheme,
+        )
+        recipient = User.objects.get(email="recipient@bench.local")
+
+        return (
+            f"/api/files/shared/{token}?v=2&part=file",
+            str(RefreshToken.for_user(recipient).access_token),
+        )
+
+    def run_interface(
+        self, interface, db_name, db_options, media_root, path, access_token, options
+    ):
+        port = get_free_port()
+        ctx = multiprocessing.get_context("spawn")
+        server = ctx.Process(
+            target=run_server,
+            args=(
+                interface,
+                db_name,
+                db_options,
+                media_root,
+                port,
+                options["timeout"] + 10,
+            ),
+        )
+        server.start()
+
+        try:
+            wait_for_port(port)
+
+            start = time.perf_counter()
+            outcomes = asyncio.run(run_clients(port, path, access_token, options))
+            wall = time.perf_counter() - start
+        finally:
+            server.terminate()
+            server.join()
+
+        done = [outcome for outcome in outcomes if outcome[0] == 200]
+        first_bytes = [first_byte * 1000 for _, first_byte, _ in done]
+        totals = [total * 1000 for _, _, total in done]
+        result = {
+            "done": len(done),
+            "failed": len(outcomes) - len(done),
+            "wall_s": wall,
+            "ttfb_p50_ms": percentile(first_bytes, 50),
+            "ttfb_p95_ms": percentile(first_bytes, 95),
+            "total_p50_ms": percentile(totals, 50),
+            "total_p95_ms": percentile(totals, 95),
+        }
+
+        self.stdout.write(
+            f"{interface:<8} {result['done']:>6} {result['failed']:>7} {wall:>8.1f} "
+            f"{result['ttfb_p50_ms']:>9.0f} {result['ttfb_p95_ms']:>9.0f} "
+            f"{result['total_p50_ms']:>10.0f} {result['total_p95_ms']:>10.0f}"
+        )
+
+        return result
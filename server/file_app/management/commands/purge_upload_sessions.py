@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from file_app.reaper import reap_expired_upload_sessions
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired resumable upload sessions and their staged chunks. "
+        "`reap_expired_files` does this along with its other sweeps."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of sessions deleted per query.",
+        )
+
+    def handle(self, *args, **options):
+        purged, stray, _ = reap_expired_upload_sessions(options["batch_size"])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Purged {purged} expired upload sessions and {stray} stray staged files."
+            )
+        )
@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from file_app.reaper import reap, vacuum_database
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired shares, expired upload sessions and their staged "
+        "chunks, files without any share left and orphaned encrypted blobs in "
+        "MEDIA_ROOT. With --interval it keeps running and reaps on a schedule."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Rows deleted per transaction.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report what would be deleted.",
+        )
+        parser.add_argument(
+            "--vacuum",
+            action="store_true",
+            help="Vacuum the database afterwards to return the freed pages.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Minutes between runs, 0 runs once.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            result = reap(options["batch_size"], options["dry_run"])
+
+            prefix = "Would delete" if options["dry_run"] else "Deleted"
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{prefix} {result.expired_shares} expired shares, "
+                    f"{result.expired_idempotency_keys} expired idempotency keys, "
+                    f"{result.expired_upload_sessions} expired upload sessions, "
+                    f"{result.stray_staged_files} stray staged files, "
+                    f"{result.unshared_files} unshared files and "
+                    f"{result.orphan_blobs} orphan blobs, "
+                    f"{result.reclaimed_bytes} bytes of blobs."
+                )
+            )
+
+            if options["vacuum"] and not options["dry_run"]:
+                vacuum_database()
+
+            if not options["interval"]:
+                return
+
+            time.sleep(options["interval"] * 60)
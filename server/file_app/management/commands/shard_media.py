@@ -0,0 +1,83 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from file_app.utils import get_sharded_blob_path
+
+
+def move_to_shard(flat_path: str) -> bool:
+    sharded_path = get_sharded_blob_path(os.path.basename(flat_path))
+    os.makedirs(os.path.dirname(sharded_path), exist_ok=True)
+
+    # a rename within MEDIA_ROOT is atomic, readers find the blob under one of
+    # the two paths at any time and already open file handles stay valid
+    try:
+        os.replace(flat_path, sharded_path)
+    except FileNotFoundError:
+        # moved by another run in the meantime
+        return False
+
+    return True
+
+
+class Command(BaseCommand):
+    help = (
+        "Move blobs stored flat in MEDIA_ROOT into the ab/cd/ fan-out layout. "
+        "Safe to run while the server is up and to interrupt, a rerun picks up "
+        "the blobs that are still flat."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=8, help="Blobs moved concurrently."
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Blobs handed to the workers at a time.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only count the blobs that are still flat.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        moved = 0
+        pending = 0
+
+        with ThreadPoolExecutor(
+            max_workers=options["workers"], thread_name_prefix="shard-media"
+        ) as executor:
+            batch = []
+
+            # scandir streams the directory instead of listing it in one go
+            with os.scandir(settings.MEDIA_ROOT) as entries:
+                for entry in entries:
+                    if not (entry.name.endswith(".enc") and entry.is_file()):
+                        continue
+
+                    pending += 1
+
+                    if options["dry_run"]:
+                        continue
+
+                    batch.append(entry.path)
+
+                    if len(batch) >= batch_size:
+                        moved += sum(executor.map(move_to_shard, batch))
+                        batch = []
+                        self.stdout.write(f"Moved {moved} blobs...")
+
+            if batch:
+                moved += sum(executor.map(move_to_shard, batch))
+
+        if options["dry_run"]:
+            self.stdout.write(f"{pending} blobs are stored flat in MEDIA_ROOT.")
+            return
+
+        self.stdout.write(self.style.SUCCESS(f"Moved {moved} blobs."))
@@ -0,0 +1,233 @@
+import base64, io, json, logging, multiprocessing, os, shutil, statistics, tempfile, time
+from contextlib import redirect_stderr
+
+import django
+from cryptography.hazmat.primitives import serialization
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def use_database(name, db_options):
+    connection = connections["default"]
+    connection.close()
+    connection.settings_dict.update(NAME=name, OPTIONS=dict(db_options))
+
+
+def run_worker(db_name, db_options, media_root, owner_id, recipients, args, ready):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "server.settings")
+    django.setup()
+
+    from django.test.utils import setup_test_environment
+    from rest_framework.test import APIClient
+
+    from auth_app.models import User
+
+    setup_test_environment()
+    logging.getLogger("django.request").setLevel(logging.CRITICAL)
+    use_database(db_name, db_options)
+    settings.MEDIA_ROOT = media_root
+
+    uploads, size, results = args
+    client = APIClient()
+    client.force_authenticate(User.objects.get(id=owner_id))
+    content = os.urandom(size)
+    file_metadata = json.dumps(
+        {
+            "name": "stress.png",
+            "mimetype": "image/png",
+            "size": size,
+            "hash": "stress",
+        }
+    )
+    encryption_key_b64 = base64.b64encode(os.urandom(32)).decode("utf-8")
+    outcomes = []
+
+    ready.wait()
+
+    # the view prints tracebacks for failed uploads, keep the report readable
+    with redirect_stderr(io.StringIO()):
+        for _ in range(uploads):
+            start = time.perf_counter()
+            response = client.post(
+                "/api/files/upload",
+                {
+                    "file": SimpleUploadedFile("stress.png.enc", content),
+                    "encryption_key_b64": encryption_key_b64,
+                    "file_metadata": file_metadata,
+                    "recipients": json.dumps(recipients),
+                },
+                format="multipart",
+            )
+            elapsed = time.perf_counter() - start
+
+            if response.status_code == 201:
+                outcome = "ok"
+            elif "locked" in str(response.data):
+                outcome = "locked"
+            else:
+                outcome = "error"
+
+            outcomes.append((outcome, elapsed))
+
+    connections.close_all()
+    results.put(outcomes)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run concurrent uploads from several processes against a throwaway SQLite "
+        "database, once with the default connection options and once with the "
+        "tuned options from settings, and report throughput and lock errors."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--profile",
+            choices=["default", "tuned", "both"],
+            default="both",
+            help="SQLite connection options to test.",
+        )
+        parser.add_argument(
+            "--processes", type=int, default=4, help="Concurrent upload processes."
+        )
+        parser.add_argument(
+            "--uploads", type=int, default=25, help="Uploads per process."
+        )
+        parser.add_argument(
+            "--size", type=int, default=64 * 1024, help="Upload size in bytes."
+        )
+        parser.add_argument(
+            "--recipients", type=int, default=2, help="Recipients per upload."
+        )
+
+    def handle(self, *args, **options):
+        connection = connections["default"]
+
+        if connection.vendor != "sqlite":
+            self.stderr.write("The default database is not SQLite.")
+            return
+
+        original = {
+            "NAME": connection.settings_dict["NAME"],
+            "OPTIONS": connection.settings_dict.get("OPTIONS", {}),
+        }
+        profiles = {"default": {}, "tuned": dict(original["OPTIONS"])}
+
+        if options["profile"] != "both":
+            profiles = {options["profile"]: profiles[options["profile"]]}
+
+        self.stdout.write(
+            f"{'profile':<8} {'ok':>6} {'locked':>7} {'errors':>7} {'uploads/s':>10} "
+            f"{'p50 ms':>8} {'p95 ms':>8}"
+        )
+
+        try:
+            for profile, db_options in profiles.items():
+                self.run_profile(profile, db_options, options)
+        finally:
+            connection.close()
+            connection.settings_dict.update(original)
+
+    def run_profile(self, profile, db_options, options):
+        from auth_app.models import User
+        from auth_app.utils import generate_rsa_key_pair
+
+        tmp_dir = tempfile.mkdtemp(prefix="stress_uploads_")
+
+        try:
+            db_name = os.path.join(tmp_dir, "db.sqlite3")
+            media_root = os.path.join(tmp_dir, "media")
+            os.makedirs(media_root)
+
+            use_database(db_name, db_options)
+            call_command("migrate", verbosity=0)
+
+            _, public_key = generate_rsa_key_pair()
+            public_key = public_key.public_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PublicFormat.SubjectPublicKeyInfo,
+            ).decode("utf-8")
+
+            owner = User.objects.create_user(
+                email="owner@stress.local",
+                username="stress_owner",
+                name="Stress Owner",
+                public_key=public_key,
+            )
+            recipients = []
+
+            for i in range(options["recipients"]):
+                User.objects.create_user(
+                    email=f"recipient{i}@stress.local",
+                    username=f"stress_recipient_{i}",
+                    name="Stress Recipient",
+                    public_key=public_key,
+                )
+                recipients.append(
+                    {
+                        "email": f"recipient{i}@stress.local",
+                        "can_view": True,
+                        "can_download": True,
+                    }
+                )
+
+            connections.close_all()
+
+            ctx = multiprocessing.get_context("spawn")
+            ready = ctx.Event()
+            results = ctx.Queue()
+            processes = [
+                ctx.Process(
+                    target=run_worker,
+                    args=(
+                        db_name,
+                        db_options,
+                        media_root,
+                        owner.id,
+                        recipients,
+                        (options["uploads"], options["size"], results),
+                        ready,
+                    ),
+                )
+                for _ in range(options["processes"])
+            ]
+
+            for process in processes:
+                process.start()
+
+            # give the workers time to import django before releasing them together
+            time.sleep(2)
+            start = time.perf_counter()
+            ready.set()
+            outcomes = []
+
+            for _ in processes:
+                outcomes.extend(results.get())
+
+            wall = time.perf_counter() - start
+
+            for process in processes:
+                process.join()
+        finally:
+            connections["default"].close()
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        counts = {"ok": 0, "locked": 0, "error": 0}
+
+        for outcome, _ in outcomes:
+            counts[outcome] += 1
+
+        latencies = [elapsed * 1000 for outcome, elapsed in outcomes if outcome == "ok"]
+        cuts = (
+            statistics.quantiles(latencies, n=100, method="inclusive")
+            if len(latencies) > 1
+            else (latencies or [0]) * 99
+        )
+
+        self.stdout.write(
+            f"{profile:<8} {counts['ok']:>6} {counts['locked']:>7} {counts['error']:>7} "
+            f"{counts['ok'] / wall:>10.1f} {cuts[49]:>8.1f} {cuts[94]:>8.1f}"
+        )
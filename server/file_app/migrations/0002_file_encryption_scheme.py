@@ -0,0 +1,38 @@
+# Generated by Django 5.1.4 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("file_app", "0001_initial"),
+    ]
+
+    operations = [
+        # files stored before this migration are single AES-GCM blobs
+        migrations.AddField(
+            model_name="file",
+            name="encryption_scheme",
+            field=models.CharField(
+                choices=[
+                    ("aesgcm", "AES-GCM (single blob)"),
+                    ("aesgcm_stream", "AES-GCM (segmented stream)"),
+                ],
+                default="aesgcm",
+                max_length=20,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="file",
+            name="encryption_scheme",
+            field=models.CharField(
+                choices=[
+                    ("aesgcm", "AES-GCM (single blob)"),
+                    ("aesgcm_stream", "AES-GCM (segmented stream)"),
+                ],
+                default="aesgcm_stream",
+                max_length=20,
+            ),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:25
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def remove_duplicate_shares(apps, schema_editor):
+    # keep the newest share of every (file, recipient) pair
+    FileShare = apps.get_model("file_app", "FileShare")
+    duplicates = (
+        FileShare.objects.values("file_id", "recipient_id")
+        .annotate(count=Count("id"), keep_id=Max("id"))
+        .filter(count__gt=1)
+    )
+
+    for duplicate in duplicates:
+        FileShare.objects.filter(
+            file_id=duplicate["file_id"], recipient_id=duplicate["recipient_id"]
+        ).exclude(id=duplicate["keep_id"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("file_app", "0003_uploadsession"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_shares, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="fileshare",
+            index=models.Index(fields=["expires_at"], name="file_share_expires_at_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="fileshare",
+            constraint=models.UniqueConstraint(
+                fields=("file", "recipient"), name="unique_file_share_recipient"
+            ),
+        ),
+    ]
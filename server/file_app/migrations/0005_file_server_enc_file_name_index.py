@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("file_app", "0004_fileshare_unique_recipient_expires_at_index"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="file",
+            name="server_enc_file_name",
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+    ]
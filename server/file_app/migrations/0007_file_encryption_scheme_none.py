@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("file_app", "0006_idempotencykey"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="file",
+            name="encryption_scheme",
+            field=models.CharField(
+                choices=[
+                    ("aesgcm", "AES-GCM (single blob)"),
+                    ("aesgcm_stream", "AES-GCM (segmented stream)"),
+                    ("none", "None (at-rest storage encryption)"),
+                ],
+                default="aesgcm_stream",
+                max_length=20,
+            ),
+        ),
+    ]
@@ -1,18 +1,31 @@
-import os
+import os, uuid
 from django.db import models
 from django.conf import settings
 
+from .utils import resolve_blob_path
+
 
 class File(models.Model):
+    ENCRYPTION_SCHEME_CHOICES = [
+        ("aesgcm", "AES-GCM (single blob)"),
+        ("aesgcm_stream", "AES-GCM (segmented stream)"),
+        # client side encryption only, served without passing through Python
+        ("none", "None (at-rest storage encryption)"),
+    ]
+
     owner = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="files"
     )
-    server_enc_file_name = models.CharField(max_length=255)
+    # indexed for the orphan blob scan of the reaper
+    server_enc_file_name = models.CharField(max_length=255, db_index=True)
     file_metadata = models.JSONField()
+    encryption_scheme = models.CharField(
+        max_length=20, choices=ENCRYPTION_SCHEME_CHOICES, default="aesgcm_stream"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
     def get_full_path(self):
-        return os.path.join(settings.MEDIA_ROOT, self.server_enc_file_name)
+        return resolve_blob_path(self.server_enc_file_name)
 
 
 class FileShare(models.Model):
@@ -25,3 +38,65 @@ class FileShare(models.Model):
     expires_at = models.DateTimeField(default=None)
     can_view = models.BooleanField(default=True)
     can_download = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            # serves the (file, recipient) lookup when a share link is opened
+            models.UniqueConstraint(
+                fields=["file", "recipient"], name="unique_file_share_recipient"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["expires_at"], name="file_share_expires_at_idx"),
+        ]
+
+
+class UploadSession(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="upload_sessions",
+    )
+    file_metadata = models.JSONField()
+    size = models.BigIntegerField()
+    received_bytes = models.BigIntegerField(default=0)
+    # index of the next chunk the session expects
+    next_chunk = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    def get_staging_path(self):
+        return os.path.join(settings.UPLOAD_STAGING_ROOT, f"{self.id.hex}.part")
+
+
+class IdempotencyKey(models.Model):
+    """
+    Outcome of a request sent with an `Idempotency-Key` header, so a retry of it
+    gets the same response. `response_status` is null while the first request is
+    still being processed.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="idempotency_keys",
+    )
+    # sha256 of the header value
+    key_hash = models.BinaryField(max_length=32)
+    # sha256 of the request, see `fingerprint_request`
+    request_hash = models.BinaryField(max_length=32, null=True)
+    response_status = models.PositiveSmallIntegerField(null=True)
+    response_body = models.JSONField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "key_hash"], name="unique_idempotency_key"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["expires_at"], name="idempotency_expires_at_idx"),
+        ]
@@ -0,0 +1,309 @@
+import os, threading, time, traceback
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import File, FileShare, IdempotencyKey, UploadSession
+from .storage import get_blob_storage
+
+
+@dataclass
+class ReapResult:
+    expired_shares: int = 0
+    expired_idempotency_keys: int = 0
+    expired_upload_sessions: int = 0
+    stray_staged_files: int = 0
+    unshared_files: int = 0
+    orphan_blobs: int = 0
+    reclaimed_bytes: int = 0
+
+
+def _blob_size(name: str) -> int:
+    try:
+        return get_blob_storage().size(name)
+    except Exception:
+        return 0
+
+
+def reap_expired_shares(batch_size: int, dry_run: bool = False) -> int:
+    """
+    Delete shares past their `expires_at` in batches, each batch in its own short
+    transaction. Returns the number of shares deleted, or that would be.
+    """
+    now = timezone.now()
+    expired = FileShare.objects.filter(expires_at__lte=now)
+
+    if dry_run:
+        return expired.count()
+
+    deleted = 0
+
+    while True:
+        # ordered by expires_at so the batch is read off the expires_at index
+        ids = list(
+            expired.order_by("expires_at").values_list("id", flat=True)[:batch_size]
+        )
+
+        if not ids:
+            return deleted
+
+        with transaction.atomic():
+            count, _ = FileShare.objects.filter(id__in=ids).delete()
+
+        deleted += count
+
+
+def reap_expired_idempotency_keys(batch_size: int, dry_run: bool = False) -> int:
+    expired = IdempotencyKey.objects.filter(expires_at__lte=timezone.now())
+
+    if dry_run:
+        return expired.count()
+
+    deleted = 0
+
+    while True:
+        ids = list(
+            expired.order_by("expires_at").values_list("id", flat=True)[:batch_size]
+        )
+
+        if not ids:
+            return deleted
+
+        with transaction.atomic():
+            count, _ = IdempotencyKey.objects.filter(id__in=ids).delete()
+
+        deleted += count
+
+
+def _staged_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def reap_expired_upload_sessions(
+    batch_size: int, dry_run: bool = False
+) -> tuple[int, int, int]:
+    """
+    Delete unfinished upload sessions past their `expires_at` along with their
+    staged chunks, then staged files that no session refers to any more.
+    Returns the number of sessions and of stray files deleted, or that would
+    be, and the bytes of staged files reclaimed.
+    """
+    expired = UploadSession.objects.filter(expires_at__lte=timezone.now())
+    sessions = stray = reclaimed = 0
+
+    if dry_run:
+        for session in expired.iterator():
+            sessions += 1
+            reclaimed += _staged_size(session.get_staging_path())
+    else:
+        while True:
+            batch = list(expired[:batch_size])
+
+            if not batch:
+                break
+
+            # rows first, a crash in between only leaves stray files behind
+            UploadSession.objects.filter(id__in=[s.id for s in batch]).delete()
+
+            for session in batch:
+                reclaimed += _staged_size(session.get_staging_path())
+
+                if os.path.exists(session.get_staging_path()):
+                    os.remove(session.get_staging_path())
+
+            sessions += len(batch)
+
+    if not os.path.isdir(settings.UPLOAD_STAGING_ROOT):
+        return sessions, stray, reclaimed
+
+    # files younger than a session's lifetime may belong to a session that is
+    # being created right now
+    cutoff = timezone.now() - timezone.timedelta(
+        minutes=settings.UPLOAD_SESSION_TTL_IN_MINS
+    )
+    live_session_ids = {
+        session_id.hex
+        for session_id in UploadSession.objects.values_list("id", flat=True)
+    }
+
+    for entry in os.scandir(settings.UPLOAD_STAGING_ROOT):
+        session_id = entry.name.removesuffix(".part")
+
+        if (
+            entry.name.endswith(".part")
+            and session_id not in live_session_ids
+            and entry.stat().st_mtime < cutoff.timestamp()
+        ):
+            stray += 1
+            reclaimed += entry.stat().st_size
+
+            if not dry_run:
+                os.remove(entry.path)
+
+    return sessions, stray, reclaimed
+
+
+def reap_unshared_files(batch_size: int) -> tuple[int, int]:
+    """
+    Delete files that no share points to any more along with their blobs.
+    Returns the number of files and blob bytes removed.
+    """
+    unshared = File.objects.filter(shares__isnull=True).order_by("id")
+    deleted = 0
+    reclaimed = 0
+    last_id = 0
+
+    while True:
+        files = list(
+            unshared.filter(id__gt=last_id).only("id", "server_enc_file_name")[
+                :batch_size
+            ]
+        )
+
+        if not files:
+            return deleted, reclaimed
+
+        last_id = files[-1].id
+
+        with transaction.atomic():
+            # a share may have been added since the batch was read
+            File.objects.filter(
+                id__in=[f.id for f in files], shares__isnull=True
+            ).delete()
+
+        # rows go first, a crash before the blobs are removed leaves orphan
+        # blobs that `reap_orphan_blobs` picks up later
+        kept = set(
+            File.objects.filter(id__in=[f.id for f in files]).values_list(
+                "id", flat=True
+            )
+        )
+
+        for f in files:
+            if f.id in kept:
+                continue
+
+            reclaimed += _blob_size(f.server_enc_file_name)
+            get_blob_storage().delete(f.server_enc_file_name)
+
+            deleted += 1
+
+
+def reap_orphan_blobs(batch_size: int, dry_run: bool = False) -> tuple[int, int]:
+    """
+    Delete `.enc` blobs in storage that no `File` refers to, such as the blob
+    of an upload whose transaction never committed. Blobs modified within the
+    grace period are left alone, their upload may still be in flight.
+    """
+    cutoff = time.time() - settings.REAPER_ORPHAN_GRACE_IN_MINS * 60
+    deleted = 0
+    reclaimed = 0
+    storage = get_blob_storage()
+    batch = []
+
+    def flush():
+        nonlocal deleted, reclaimed
+
+        referenced = set(
+            File.objects.filter(server_enc_file_name__in=batch).values_list(
+                "server_enc_file_name", flat=True
+            )
+        )
+
+        for name in batch:
+            if name in referenced:
+                continue
+
+            reclaimed += _blob_size(name)
+            deleted += 1
+
+            if not dry_run:
+                storage.delete(name)
+
+        batch.clear()
+
+    for name, modified_at in storage.list():
+        if modified_at >= cutoff:
+            continue
+
+        batch.append(name)
+
+        if len(batch) >= batch_size:
+            flush()
+
+    if batch:
+        flush()
+
+    return deleted, reclaimed
+
+
+def vacuum_database():
+    # VACUUM cannot run inside a transaction, the connection is in autocommit here
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute("VACUUM")
+        elif connection.vendor == "postgresql":
+            cursor.execute(
+                f"VACUUM (ANALYZE) {FileShare._meta.db_table}, {File._meta.db_table}"
+            )
+
+
+def reap(batch_size: int = 500, dry_run: bool = False) -> ReapResult:
+    result = ReapResult()
+    result.expired_shares = reap_expired_shares(batch_size, dry_run)
+    result.expired_idempotency_keys = reap_expired_idempotency_keys(batch_size, dry_run)
+    result.expired_upload_sessions, result.stray_staged_files, reclaimed = (
+        reap_expired_upload_sessions(batch_size, dry_run)
+    )
+    result.reclaimed_bytes += reclaimed
+
+    # a dry run deletes no shares, so count the files whose shares have all expired
+    if dry_run:
+        files = File.objects.exclude(shares__expires_at__gt=timezone.now())
+        result.unshared_files = files.count()
+        result.reclaimed_bytes += sum(
+            _blob_size(f.server_enc_file_name)
+            for f in files.only("server_enc_file_name").iterator()
+        )
+    else:
+        result.unshared_files, reclaimed = reap_unshared_files(batch_size)
+        result.reclaimed_bytes += reclaimed
+
+    result.orphan_blobs, reclaimed = reap_orphan_blobs(batch_size, dry_run)
+    result.reclaimed_bytes += reclaimed
+
+    return result
+
+
+def start_periodic_reaper():
+    """
+    Run `reap` every `REAPER_INTERVAL_IN_MINS` on a daemon thread of the current
+    process. Does nothing when the interval is 0, the default, in which case
+    `manage.py reap_expired_files --interval` is expected to run instead.
+    """
+    interval = settings.REAPER_INTERVAL_IN_MINS * 60
+
+    if not interval:
+        return None
+
+    def run():
+        while True:
+            time.sleep(interval)
+
+            try:
+                close_old_connections()
+                reap()
+            except Exception:
+                traceback.print_exc()
+            finally:
+                close_old_connections()
+
+    thread = threading.Thread(target=run, name="file-reaper", daemon=True)
+    thread.start()
+
+    return thread
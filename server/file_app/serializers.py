@@ -4,25 +4,17 @@ from django.conf import settings
 from auth_app.validators import validate_email
 
 
-class FileUploadSerializer(serializers.Serializer):
-    file = serializers.FileField(required=True)
-    encryption_key_b64 = serializers.CharField(required=True)
-    file_metadata = serializers.CharField(required=True)
-    recipients = serializers.CharField(required=False)
+def validate_file_size(size: int):
+    max_file_size_in_bytes = settings.FILE_SIZE_LIMIT_IN_MB * 1024 * 1024
 
-    def validate_file(self, value):
-        max_file_size_in_bytes = settings.FILE_SIZE_LIMIT_IN_MB * 1024 * 1024
+    if size > max_file_size_in_bytes:
+        raise serializers.ValidationError(
+            f"File size exceeds the maximum limit of {settings.FILE_SIZE_LIMIT_IN_MB} MB."
+        )
 
-        if value.size > max_file_size_in_bytes:
-            raise serializers.ValidationError(
-                f"File size exceeds the maximum limit of {settings.FILE_SIZE_LIMIT_IN_MB} MB."
-            )
 
-        # uploaded file is client side ecrypted and should have the extension `.enc`
-        if not value.name.lower().endswith((".enc")):
-            raise serializers.ValidationError("Invalid encrypted file.")
-
-        return value
+class FileMetadataSerializer(serializers.Serializer):
+    file_metadata = serializers.CharField(required=True)
 
     def validate_file_metadata(self, value):
         try:
@@ -71,6 +63,11 @@ class FileUploadSerializer(serializers.Serializer):
 
         return metadata
 
+
+class ShareRecipientsSerializer(serializers.Serializer):
+    encryption_key_b64 = serializers.CharField(required=True)
+    recipients = serializers.CharField(required=False)
+
     def validate_encryption_key_b64(self, value):
         try:
             return base64.b64decode(value)
@@ -113,3 +110,25 @@ class FileUploadSerializer(serializers.Serializer):
                 filtered_recipients.append(recipient)
 
         return filtered_recipients
+
+
+class FileUploadSerializer(FileMetadataSerializer, ShareRecipientsSerializer):
+    file = serializers.FileField(required=True)
+
+    def validate_file(self, value):
+        validate_file_size(value.size)
+
+        # uploaded file is client side ecrypted and should have the extension `.enc`
+        if not value.name.lower().endswith((".enc")):
+            raise serializers.ValidationError("Invalid encrypted file.")
+
+        return value
+
+
+class UploadSessionSerializer(FileMetadataSerializer):
+    # size in bytes of the client side encrypted file that will be uploaded
+    size = serializers.IntegerField(required=True, min_value=1)
+
+    def validate_size(self, value):
+        validate_file_size(value)
+        return value
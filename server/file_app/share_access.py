@@ -0,0 +1,159 @@
+import json
+from dataclasses import dataclass
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+from server.db_router import reading_from_replica
+from .models import File, FileShare
+
+
+@dataclass
+class ShareAccess:
+    """
+    What `SharedFileAccessView` needs of a share, with the permissions and
+    metadata parts of the response already serialized.
+    """
+
+    file: File
+    can_view: bool
+    expires_at: datetime
+    share_permission_data: str
+    file_metadata: str
+
+
+def get_share_access_cache():
+    return caches["share_access"]
+
+
+def get_share_access_key(file_id, recipient_id) -> str:
+    return f"share_access:{file_id}:{recipient_id}"
+
+
+def build_share_access(share: FileShare) -> ShareAccess:
+    f_obj = share.file
+
+    permissions_data = {
+        "can_view": share.can_view,
+        "can_download": share.can_download,
+        "expires_at": share.expires_at.isoformat(),
+        "encrypted_file_key": share.encrypted_file_key,
+    }
+
+    metadata = {
+        **f_obj.file_metadata,
+        "owner": {
+            "name": f_obj.owner.name,
+            "username": f_obj.owner.username,
+        },
+    }
+
+    return ShareAccess(
+        # only what is needed to read the blob is kept
+        file=File(
+            id=f_obj.id,
+            owner_id=f_obj.owner_id,
+            server_enc_file_name=f_obj.server_enc_file_name,
+            encryption_scheme=f_obj.encryption_scheme,
+        ),
+        can_view=share.can_view,
+        expires_at=share.expires_at,
+        share_permission_data=json.dumps(permissions_data, ensure_ascii=False),
+        file_metadata=json.dumps(metadata, ensure_ascii=False),
+    )
+
+
+def get_share_access_timeout(share: FileShare) -> float:
+    return min(
+        settings.SHARE_ACCESS_CACHE_TTL_IN_MINS * 60,
+        (share.expires_at - timezone.now()).total_seconds(),
+    )
+
+
+def get_share_access(file_id, recipient) -> ShareAccess | None:
+    """
+    The share of `file_id` with `recipient`, or None when there is none. Found
+    shares are cached until they expire, for at most
+    `SHARE_ACCESS_CACHE_TTL_IN_MINS`. Missing shares are not cached.
+    """
+    cache = get_share_access_cache()
+    key = get_share_access_key(file_id, recipient.id)
+    access = cache.get(key)
+
+    if access is not None:
+        return access
+
+    shares = FileShare.objects.select_related("file__owner")
+
+    try:
+        try:
+            share = shares.get(file__id=file_id, recipient=recipient)
+        except FileShare.DoesNotExist:
+            # a share created moments ago may not have replicated yet
+            if not reading_from_replica():
+                raise
+
+            share = shares.using(DEFAULT_DB_ALIAS).get(
+                file__id=file_id, recipient=recipient
+            )
+    except FileShare.DoesNotExist:
+        return None
+
+    access = build_share_access(share)
+    timeout = get_share_access_timeout(share)
+
+    # expired shares are rejected by the view, there is no point caching them
+    if timeout > 0:
+        cache.set(key, access, timeout)
+
+    return access
+
+
+async def aget_share_access(file_id, recipient) -> ShareAccess | None:
+    """
+    `get_share_access` for async views, through the async cache and ORM APIs.
+    """
+    cache = get_share_access_cache()
+    key = get_share_access_key(file_id, recipient.id)
+    access = await cache.aget(key)
+
+    if access is not None:
+        return access
+
+    shares = FileShare.objects.select_related("file__owner")
+
+    try:
+        try:
+            share = await shares.aget(file__id=file_id, recipient=recipient)
+        except FileShare.DoesNotExist:
+            if not reading_from_replica():
+                raise
+
+            share = await shares.using(DEFAULT_DB_ALIAS).aget(
+                file__id=file_id, recipient=recipient
+            )
+    except FileShare.DoesNotExist:
+        return None
+
+    access = build_share_access(share)
+    timeout = get_share_access_timeout(share)
+
+    if timeout > 0:
+        await cache.aset(key, access, timeout)
+
+    return access
+
+
+def invalidate_share_access(pairs) -> None:
+    """
+    Drop the cached shares of the `(file_id, recipient_id)` pairs.
+    """
+    keys = [
+        get_share_access_key(file_id, recipient_id) for file_id, recipient_id in pairs
+    ]
+
+    if keys:
+        get_share_access_cache().delete_many(keys)
@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import File, FileShare
+from .share_access import invalidate_share_access
+from .utils import public_key_cache
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_public_key_on_save(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and "public_key" not in update_fields:
+        return
+
+    public_key_cache.invalidate(instance.id)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_public_key_on_delete(sender, instance, **kwargs):
+    public_key_cache.invalidate(instance.id)
+
+
+@receiver(post_save, sender=FileShare)
+@receiver(post_delete, sender=FileShare)
+def invalidate_share_access_on_share_change(sender, instance, **kwargs):
+    invalidate_share_access([(instance.file_id, instance.recipient_id)])
+
+
+@receiver(post_save, sender=File)
+def invalidate_share_access_on_file_save(sender, instance, created, **kwargs):
+    # shares of deleted files are deleted with them and invalidated above
+    if created:
+        return
+
+    invalidate_share_access(
+        FileShare.objects.filter(file=instance).values_list("file_id", "recipient_id")
+    )
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_share_access_on_owner_save(
+    sender, instance, created, update_fields=None, **kwargs
+):
+    # the owner's name and username are part of the cached metadata
+    if created or (
+        update_fields is not None and not {"name", "username"} & set(update_fields)
+    ):
+        return
+
+    invalidate_share_access(
+        FileShare.objects.filter(file__owner=instance).values_list(
+            "file_id", "recipient_id"
+        )
+    )
@@ -0,0 +1,465 @@
+import io, os, threading
+from typing import BinaryIO, Iterator
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from .utils import create_blob_path, resolve_blob_path
+
+
+class BlobStorage:
+    """
+    Where the encrypted blobs of files are kept. Blobs are addressed by the
+    `File.server_enc_file_name` they were stored under.
+    """
+
+    def open(self, name: str, mode: str = "rb") -> BinaryIO:
+        """
+        A seekable reader for "rb", a writer for "wb". Both are context managers,
+        a writer that exits with an exception leaves no blob behind.
+        """
+        raise NotImplementedError
+
+    def exists(self, name: str) -> bool:
+        raise NotImplementedError
+
+    def size(self, name: str) -> int:
+        raise NotImplementedError
+
+    def delete(self, name: str) -> None:
+        """
+        Remove the blob, missing blobs are ignored.
+        """
+        raise NotImplementedError
+
+    def list(self) -> Iterator[tuple[str, float]]:
+        """
+        Name and last modified timestamp of every stored blob.
+        """
+        raise NotImplementedError
+
+    def path(self, name: str) -> str | None:
+        """
+        Local filesystem path of the blob, for storages that have one.
+        """
+        return None
+
+
+class LocalBlobStorage(BlobStorage):
+    """
+    Blobs in the fan-out layout under MEDIA_ROOT, see `resolve_blob_path`.
+    """
+
+    def open(self, name, mode="rb"):
+        if mode == "wb":
+            return _LocalBlobWriter(create_blob_path(name))
+
+        return open(resolve_blob_path(name), "rb")
+
+    def exists(self, name):
+        return os.path.exists(resolve_blob_path(name))
+
+    def size(self, name):
+        return os.path.getsize(resolve_blob_path(name))
+
+    def path(self, name):
+        return resolve_blob_path(name)
+
+    def delete(self, name):
+        try:
+            os.remove(resolve_blob_path(name))
+        except FileNotFoundError:
+            pass
+
+    def list(self):
+        staging_root = os.fspath(settings.UPLOAD_STAGING_ROOT)
+
+        for root, dirs, files in os.walk(settings.MEDIA_ROOT):
+            # staged chunks of upload sessions are not blobs
+            dirs[:] = [d for d in dirs if os.path.join(root, d) != staging_root]
+
+            for name in files:
+                if not name.endswith(".enc"):
+                    continue
+
+                try:
+                    yield name, os.stat(os.path.join(root, name)).st_mtime
+                except FileNotFoundError:
+                    continue
+
+
+class _LocalBlobWriter(io.FileIO):
+    def __init__(self, path):
+        super().__init__(path, "wb")
+
+    def __exit__(self, exc_type, exc, tb):
+        super().__exit__(exc_type, exc, tb)
+
+        if exc_type is not None and os.path.exists(self.name):
+            os.remove(self.name)
+
+
+class S3BlobStorage(BlobStorage):
+    """
+    Blobs in an S3 compatible bucket, configured by the `S3_STORAGE` setting.
+    Writes go through multipart uploads and reads are streamed from bounded
+    ranged GETs. One boto3 client, and with it one HTTP
+    connection pool, is shared by all threads of the process.
+    """
+
+    def __init__(self):
+        try:
+            import boto3
+            from botocore.config import Config
+        except ImportError as e:
+            raise ImproperlyConfigured(
+                "The s3 blob storage requires boto3, pip install boto3."
+            ) from e
+
+        options = settings.S3_STORAGE
+
+        if not options.get("BUCKET"):
+            raise ImproperlyConfigured("S3_STORAGE['BUCKET'] is not set.")
+
+        self.bucket = options["BUCKET"]
+        self.prefix = options.get("PREFIX", "")
+        self.part_size = options.get("MULTIPART_PART_SIZE", 8 * 1024 * 1024)
+        self.client = boto3.session.Session().client(
+            "s3",
+            endpoint_url=options.get("ENDPOINT_URL") or None,
+            region_name=options.get("REGION") or None,
+            aws_access_key_id=options.get("ACCESS_KEY_ID") or None,
+            aws_secret_access_key=options.get("SECRET_ACCESS_KEY") or None,
+            config=Config(
+                max_pool_connections=options.get("MAX_POOL_CONNECTIONS", 32),
+                retries={"max_attempts": 3, "mode": "standard"},
+                # path style addressing works with MinIO without DNS setup
+                s3={"addressing_style": options.get("ADDRESSING_STYLE", "auto")},
+            ),
+        )
+
+    def get_key(self, name):
+        # the same fan-out as on disk spreads keys over prefixes
+        return f"{self.prefix}{name[:2]}/{name[2:4]}/{name}"
+
+    def is_not_found(self, error):
+        return error.response.get("Error", {}).get("Code") in (
+            "404",
+            "NoSuchKey",
+            "NotFound",
+        )
+
+    def open(self, name, mode="rb"):
+        if mode == "wb":
+            return _S3BlobWriter(self, self.get_key(name))
+
+        return _S3BlobReader(self, self.get_key(name))
+
+    def exists(self, name):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.get_key(name))
+        except self.client.exceptions.ClientError as e:
+            if self.is_not_found(e):
+                return False
+
+            raise
+
+        return True
+
+    def size(self, name):
+        return self.client.head_object(Bucket=self.bucket, Key=self.get_key(name))[
+            "ContentLength"
+        ]
+
+    def delete(self, name):
+        # deleting a missing key succeeds on S3
+        self.client.delete_object(Bucket=self.bucket, Key=self.get_key(name))
+
+    def list(self):
+        paginator = self.client.get_paginator("list_objects_v2")
+
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get("Contents", []):
+                name = item["Key"].rsplit("/", 1)[-1]
+
+                if name.endswith(".enc"):
+                    yield name, item["LastModified"].timestamp()
+
+
+class _S3BlobWriter(io.RawIOBase):
+    """
+    Buffers writes into parts of `part_size` bytes and uploads them as one
+    multipart upload. Blobs smaller than a part are stored with a single PUT.
+    """
+
+    def __init__(self, storage, key):
+        self.storage = storage
+        self.key = key
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+
+        while len(self.buffer) >= self.storage.part_size:
+            self.upload_part(bytes(self.buffer[: self.storage.part_size]))
+            del self.buffer[: self.storage.part_size]
+
+        return len(data)
+
+    def upload_part(self, data):
+        client = self.storage.client
+
+        if self.upload_id is None:
+            self.upload_id = client.create_multipart_upload(
+                Bucket=self.storage.bucket, Key=self.key
+            )["UploadId"]
+
+        part_number = len(self.parts) + 1
+        response = client.upload_part(
+            Bucket=self.storage.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=data,
+        )
+        self.parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+
+    def close(self):
+        if self.closed:
+            return
+
+        client = self.storage.client
+
+        try:
+            if self.upload_id is None:
+                client.put_object(
+                    Bucket=self.storage.bucket, Key=self.key, Body=bytes(self.buffer)
+                )
+            else:
+                if self.buffer:
+                    self.upload_part(bytes(self.buffer))
+
+                client.complete_multipart_upload(
+                    Bucket=self.storage.bucket,
+                    Key=self.key,
+                    UploadId=self.upload_id,
+                    MultipartUpload={"Parts": self.parts},
+                )
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self.buffer = bytearray()
+            super().close()
+
+    def abort(self):
+        if self.upload_id is not None:
+            self.storage.client.abort_multipart_upload(
+                Bucket=self.storage.bucket, Key=self.key, UploadId=self.upload_id
+            )
+            self.upload_id = None
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+            self.buffer = bytearray()
+            # nothing was stored, skip the upload in close
+            io.RawIOBase.close(self)
+            return
+
+        self.close()
+
+
+class _S3BlobReader(io.RawIOBase):
+    """
+    Seekable reader over an object. Reads are served from bounded ranged GETs,
+    windows starting at the read position that double while reads continue
+    sequentially, so a seek never aborts more than one window. The length is
+    read off the Content-Range of the first GET instead of a HEAD request.
+    """
+
+    # sizes of the first and the largest window of a sequential run
+    MIN_WINDOW = 256 * 1024
+    MAX_WINDOW = 16 * 1024 * 1024
+
+    # remainders up to this size are read to the end instead of closing the
+    # body, which would drop its connection from the pool. Seeks forward within
+    # the window skip as far on the open body
+    DRAIN_LIMIT = MIN_WINDOW
+
+    def __init__(self, storage, key):
+        self.storage = storage
+        self.key = key
+        self.position = 0
+        self.length = None
+        self.body = None
+        self.body_position = 0
+        self.window_end = 0
+        self.window = self.MIN_WINDOW
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.get_length()
+
+        # the body is kept, the next read decides if it can continue from it
+        self.position = offset
+
+        return self.position
+
+    def get_length(self):
+        if self.length is None:
+            # the window is fetched at the read position and kept for the read
+            # that usually follows
+            self.open_window(0)
+
+        if self.length is None:
+            self.length = self.storage.client.head_object(
+                Bucket=self.storage.bucket, Key=self.key
+            )["ContentLength"]
+
+        return self.length
+
+    def open_window(self, size):
+        self.close_body()
+
+        end = self.position + max(size, self.window) - 1
+
+        if self.length is not None:
+            end = min(end, self.length - 1)
+
+        try:
+            response = self.storage.client.get_object(
+                Bucket=self.storage.bucket,
+                Key=self.key,
+                Range=f"bytes={self.position}-{end}",
+            )
+        except self.storage.client.exceptions.ClientError as e:
+            if self.storage.is_not_found(e):
+                raise FileNotFoundError(self.key) from e
+
+            # the position is at or past the end, empty objects have no range
+            if e.response.get("Error", {}).get("Code") == "InvalidRange":
+                return
+
+            raise
+
+        # "bytes <first>-<last>/<length>"
+        byte_range, _, length = response["ContentRange"].rpartition("/")
+        self.length = int(length)
+        self.body = response["Body"]
+        self.body_position = self.position
+        self.window_end = int(byte_range.rpartition("-")[2]) + 1
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            chunks = []
+
+            while chunk := self.read(self.MAX_WINDOW):
+                chunks.append(chunk)
+
+            return b"".join(chunks)
+
+        chunks = []
+
+        while size > 0:
+            if self.length is not None and self.position >= self.length:
+                break
+
+            if self.body is not None and self.body_position != self.position:
+                skip = self.position - self.body_position
+
+                if 0 < skip <= self.DRAIN_LIMIT and self.position < self.window_end:
+                    self.body.read(skip)
+                    self.body_position = self.position
+                else:
+                    # a new sequential run starts at the seek target
+                    self.close_body()
+                    self.window = self.MIN_WINDOW
+
+            if self.body is None:
+                self.open_window(size)
+
+                if self.body is None:
+                    break
+
+            data = self.body.read(min(size, self.window_end - self.position))
+
+            if not data:
+                self.close_body()
+                break
+
+            chunks.append(data)
+            size -= len(data)
+            self.position += len(data)
+            self.body_position = self.position
+
+            if self.position >= self.window_end:
+                # a fully read body has already released its connection
+                self.body = None
+                self.window = min(self.window * 2, self.MAX_WINDOW)
+
+        return b"".join(chunks)
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[: len(data)] = data
+
+        return len(data)
+
+    def close_body(self):
+        if self.body is None:
+            return
+
+        if self.window_end - self.body_position <= self.DRAIN_LIMIT:
+            self.body.read()
+
+        self.body.close()
+        self.body = None
+
+    def close(self):
+        self.close_body()
+        super().close()
+
+
+BLOB_STORAGE_BACKENDS = {
+    "local": "file_app.storage.LocalBlobStorage",
+    "s3": "file_app.storage.S3BlobStorage",
+}
+
+_blob_storage = None
+_blob_storage_lock = threading.Lock()
+
+
+def get_blob_storage() -> BlobStorage:
+    """
+    The process wide storage selected by the `BLOB_STORAGE` setting, either a
+    key of `BLOB_STORAGE_BACKENDS` or the dotted path of a `BlobStorage` class.
+    """
+    global _blob_storage
+
+    if _blob_storage is None:
+        with _blob_storage_lock:
+            if _blob_storage is None:
+                backend = BLOB_STORAGE_BACKENDS.get(
+                    settings.BLOB_STORAGE, settings.BLOB_STORAGE
+                )
+                _blob_storage = import_string(backend)()
+
+    return _blob_storage
@@ -1,3 +1,553 @@
-from django.test import TestCase
+import io, os, json, math, time, uuid, base64, shutil, tempfile
 
-# Create your tests here.
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import serialization
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import path
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from auth_app.models import User
+from auth_app.utils import generate_rsa_key_pair
+from .async_views import AsyncFileUploadView
+from .models import File, FileShare, UploadSession
+from .reaper import reap
+from .storage import get_blob_storage
+from .share_access import (
+    get_share_access,
+    get_share_access_cache,
+    get_share_access_key,
+)
+from .utils import encrypt_stream, decrypt_stream, decrypt_stream_range
+
+# recipient lookup, savepoint, file insert, share insert, savepoint release
+UPLOAD_QUERIES = 5
+
+
+class FileUploadTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        _, public_key = generate_rsa_key_pair()
+        public_key = public_key.public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo,
+        ).decode("utf-8")
+
+        cls.owner = User.objects.create_user(
+            email="owner@test.local",
+            username="test_owner",
+            name="Test Owner",
+            public_key=public_key,
+        )
+        User.objects.bulk_create(
+            [
+                User(
+                    email=f"recipient{i}@test.local",
+                    username=f"recipient_{i}",
+                    name="Test Recipient",
+                    public_key=public_key,
+                )
+                for i in range(200)
+            ]
+        )
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(
+            override_settings(
+                MEDIA_ROOT=media_root,
+                UPLOAD_STAGING_ROOT=os.path.join(media_root, "uploads"),
+            )
+        )
+        # file ids are reused once a test's rows are rolled back
+        self.addCleanup(get_share_access_cache().clear)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def upload(self, recipient_count, content=b"encrypted"):
+        recipients = [
+            {
+                "email": f"recipient{i}@test.local",
+                "can_view": True,
+                "can_download": False,
+            }
+            for i in range(recipient_count)
+        ]
+
+        return self.client.post(
+            "/api/files/upload",
+            {
+                "file": SimpleUploadedFile("test.png.enc", content),
+                "encryption_key_b64": base64.b64encode(b"k" * 32).decode("utf-8"),
+                "file_metadata": json.dumps(
+                    {
+                        "name": "test.png",
+                        "mimetype": "image/png",
+                        "size": len(content),
+                        "hash": "h",
+                    }
+                ),
+                "recipients": json.dumps(recipients),
+            },
+            format="multipart",
+        )
+
+
+class FileUploadQueriesTest(FileUploadTestCase):
+    def extra_insert_batches(self, share_count):
+        # SQLite caps the parameters of a query, bulk_create splits inserts
+        # that would exceed it
+        fields = [f for f in FileShare._meta.concrete_fields if not f.primary_key]
+        batch_size = connection.ops.bulk_batch_size(fields, [None] * share_count)
+
+        return math.ceil(share_count / batch_size) - 1
+
+    def assertUploadQueries(self, recipient_count, queries):
+        with self.assertNumQueries(
+            queries + self.extra_insert_batches(recipient_count + 1)
+        ):
+            response = self.upload(recipient_count)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(FileShare.objects.count(), recipient_count + 1)
+
+    def test_upload_without_recipients(self):
+        # an empty recipient list needs no lookup
+        self.assertUploadQueries(0, UPLOAD_QUERIES - 1)
+
+    def test_upload_with_one_recipient(self):
+        self.assertUploadQueries(1, UPLOAD_QUERIES)
+
+    def test_upload_with_many_recipients(self):
+        self.assertUploadQueries(200, UPLOAD_QUERIES)
+
+
+class FileShareIndexTest(TestCase):
+    """
+    The share lookup of the shared file access view and the expiry sweep of the
+    reaper are read off FileShare's indexes instead of scanning the table.
+    """
+
+    def explain(self, queryset):
+        if connection.vendor == "postgresql":
+            # the tables of a test database are small enough to prefer a scan
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+
+        return queryset.explain()
+
+    def test_share_lookup_uses_unique_constraint(self):
+        plan = self.explain(
+            FileShare.objects.select_related("file__owner").filter(
+                file__id=1, recipient_id=1
+            )
+        )
+
+        if connection.vendor == "sqlite":
+            # the constraint is an index SQLite names after the table
+            self.assertIn("USING INDEX", plan)
+            self.assertIn("(file_id=? AND recipient_id=?)", plan)
+        else:
+            self.assertIn("unique_file_share_recipient", plan)
+
+    def test_expiry_sweep_uses_expires_at_index(self):
+        plan = self.explain(
+            FileShare.objects.filter(expires_at__lte=timezone.now())
+            .order_by("expires_at")
+            .values_list("id", flat=True)[:100]
+        )
+
+        self.assertIn("file_share_expires_at_idx", plan)
+
+
+class FileUploadIdempotencyTest(FileUploadTestCase):
+    def upload(self, recipient_count, key="upload-1"):
+        self.client.credentials(HTTP_IDEMPOTENCY_KEY=key)
+
+        return super().upload(recipient_count)
+
+    def test_retry_is_replayed(self):
+        first = self.upload(1)
+        retry = self.upload(1)
+
+        self.assertEqual(retry.status_code, first.status_code)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(FileShare.objects.count(), 2)
+
+    def test_key_reused_for_another_request(self):
+        self.upload(1)
+        response = self.upload(2)
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(FileShare.objects.count(), 2)
+
+
+# routes the upload to the async view, for tests run with ROOT_URLCONF=__name__
+urlpatterns = [path("api/files/upload", AsyncFileUploadView.as_view())]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncFileUploadIdempotencyTest(FileUploadIdempotencyTest):
+    """
+    The same checks against the view served with ASYNC_FILE_VIEWS.
+    """
+
+
+class ShareAccessInvalidationTest(FileUploadTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.upload(1)
+        share = FileShare.objects.get(recipient__email="recipient0@test.local")
+        get_share_access(share.file_id, share.recipient)
+        self.key = get_share_access_key(share.file_id, share.recipient_id)
+
+    def test_owner_login_keeps_cached_shares(self):
+        self.owner.last_login = timezone.now()
+        self.owner.save(update_fields=["last_login"])
+
+        self.assertIsNotNone(get_share_access_cache().get(self.key))
+
+    def test_owner_rename_drops_cached_shares(self):
+        self.owner.name = "Renamed Owner"
+        self.owner.save(update_fields=["name"])
+
+        self.assertIsNone(get_share_access_cache().get(self.key))
+
+
+def encrypt_bytes(data, segment_size):
+    return b"".join(encrypt_stream(io.BytesIO(data), segment_size))
+
+
+def decrypt_bytes(blob):
+    return b"".join(decrypt_stream(io.BytesIO(blob), len(blob)))
+
+
+class StreamEncryptionTest(TestCase):
+    segment_size = 1024
+
+    def test_round_trip(self):
+        for size in [0, 1, self.segment_size, 3 * self.segment_size + 7]:
+            with self.subTest(size=size):
+                data = os.urandom(size)
+                blob = encrypt_bytes(data, self.segment_size)
+
+                self.assertEqual(decrypt_bytes(blob), data)
+
+    def test_range_across_segments(self):
+        data = os.urandom(3 * self.segment_size + 7)
+        blob = encrypt_bytes(data, self.segment_size)
+        start, end = self.segment_size - 10, 2 * self.segment_size + 10
+
+        decrypted = b"".join(
+            decrypt_stream_range(io.BytesIO(blob), len(blob), start, end)
+        )
+
+        self.assertEqual(decrypted, data[start : end + 1])
+
+    def test_tampered_segment_fails(self):
+        blob = bytearray(
+            encrypt_bytes(os.urandom(3 * self.segment_size), self.segment_size)
+        )
+        blob[-self.segment_size] ^= 1
+
+        with self.assertRaises(InvalidTag):
+            decrypt_bytes(bytes(blob))
+
+    def test_truncated_file_fails(self):
+        blob = encrypt_bytes(os.urandom(3 * self.segment_size), self.segment_size)
+
+        # the segment before the cut was not encrypted as the last one
+        with self.assertRaises(InvalidTag):
+            decrypt_bytes(blob[: -(self.segment_size + 16)])
+
+
+@override_settings(FILE_ENCRYPTION_SEGMENT_SIZE=1024)
+class SharedFileRangeTest(FileUploadTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.content = os.urandom(3 * 1024 + 7)
+        self.token = self.upload(0, self.content).data["share_token"]
+
+    def download(self, range_header=None):
+        headers = {"HTTP_RANGE": range_header} if range_header else {}
+        response = self.client.get(
+            f"/api/files/shared/{self.token}", {"v": "2", "part": "file"}, **headers
+        )
+        body = b"".join(response.streaming_content) if response.streaming else b""
+
+        return response, body
+
+    def assertPartial(self, range_header, start, end):
+        response, body = self.download(range_header)
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(
+            response["Content-Range"], f"bytes {start}-{end}/{len(self.content)}"
+        )
+        self.assertEqual(body, self.content[start : end + 1])
+
+    def assertFull(self, range_header):
+        response, body = self.download(range_header)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+
+    def test_without_range(self):
+        self.assertFull(None)
+
+    def test_range_across_segments(self):
+        self.assertPartial("bytes=1000-2100", 1000, 2100)
+
+    def test_suffix_range(self):
+        size = len(self.content)
+        self.assertPartial("bytes=-100", size - 100, size - 1)
+
+    def test_open_ended_range(self):
+        self.assertPartial("bytes=2000-", 2000, len(self.content) - 1)
+
+    def test_ignored_ranges(self):
+        for range_header in ["bytes=0-1,5-6", "bytes=abc", "items=0-1", "bytes=5-1"]:
+            with self.subTest(range_header):
+                self.assertFull(range_header)
+
+    def test_unsatisfiable_range(self):
+        response, _ = self.download(f"bytes={len(self.content)}-")
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], f"bytes */{len(self.content)}")
+
+
+class ReaperTest(FileUploadTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.upload(1)
+        self.upload(1)
+        self.expired_file, self.live_file = File.objects.order_by("id")
+        FileShare.objects.filter(file=self.expired_file).update(
+            expires_at=timezone.now() - timezone.timedelta(minutes=1)
+        )
+
+        self.old_orphan_blob = self.store_blob(age_in_mins=120)
+        self.new_orphan_blob = self.store_blob(age_in_mins=0)
+
+        os.makedirs(settings.UPLOAD_STAGING_ROOT)
+        self.expired_session = self.create_session(expires_in_mins=-1)
+        self.live_session = self.create_session(expires_in_mins=60)
+        self.stray_staged_file = self.stage(
+            os.path.join(settings.UPLOAD_STAGING_ROOT, f"{uuid.uuid4().hex}.part"),
+            age_in_mins=24 * 60,
+        )
+
+    def age(self, path, age_in_mins):
+        modified_at = time.time() - age_in_mins * 60
+        os.utime(path, (modified_at, modified_at))
+
+    def store_blob(self, age_in_mins):
+        name = f"{uuid.uuid4().hex}.enc"
+
+        with get_blob_storage().open(name, "wb") as f:
+            f.write(b"orphan")
+
+        self.age(get_blob_storage().path(name), age_in_mins)
+
+        return name
+
+    def stage(self, path, age_in_mins=0):
+        with open(path, "wb") as f:
+            f.write(b"chunk")
+
+        self.age(path, age_in_mins)
+
+        return path
+
+    def create_session(self, expires_in_mins):
+        session = UploadSession.objects.create(
+            owner=self.owner,
+            file_metadata={},
+            size=5,
+            expires_at=timezone.now() + timezone.timedelta(minutes=expires_in_mins),
+        )
+        self.stage(session.get_staging_path())
+
+        return session
+
+    def test_reap_removes_only_expired_and_orphaned_data(self):
+        result = reap()
+
+        self.assertEqual(result.expired_shares, 2)
+        self.assertEqual(result.unshared_files, 1)
+        self.assertEqual(result.orphan_blobs, 1)
+        self.assertEqual(result.expired_upload_sessions, 1)
+        self.assertEqual(result.stray_staged_files, 1)
+
+        storage = get_blob_storage()
+        self.assertFalse(File.objects.filter(id=self.expired_file.id).exists())
+        self.assertFalse(storage.exists(self.expired_file.server_enc_file_name))
+        self.assertFalse(storage.exists(self.old_orphan_blob))
+        self.assertFalse(os.path.exists(self.expired_session.get_staging_path()))
+        self.assertFalse(os.path.exists(self.stray_staged_file))
+
+        self.assertEqual(FileShare.objects.filter(file=self.live_file).count(), 2)
+        self.assertTrue(storage.exists(self.live_file.server_enc_file_name))
+        self.assertTrue(storage.exists(self.new_orphan_blob))
+        self.assertTrue(UploadSession.objects.filter(id=self.live_session.id).exists())
+        self.assertTrue(os.path.exists(self.live_session.get_staging_path()))
+
+    def test_dry_run_removes_nothing(self):
+        result = reap(dry_run=True)
+
+        self.assertEqual(result.unshared_files, 1)
+        self.assertEqual(result.orphan_blobs, 1)
+        self.assertEqual(result.stray_staged_files, 1)
+        self.assertEqual(File.objects.count(), 2)
+        self.assertTrue(get_blob_storage().exists(self.old_orphan_blob))
+        self.assertTrue(os.path.exists(self.stray_staged_file))
+
+
+@override_settings(FILE_STORAGE_ENCRYPTION_SCHEME="none")
+class SendfileTest(FileUploadTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.content = os.urandom(2048)
+        self.token = self.upload(0, self.content).data["share_token"]
+        self.blob_path = get_blob_storage().path(
+            File.objects.get().server_enc_file_name
+        )
+
+    def download(self):
+        return self.client.get(
+            f"/api/files/shared/{self.token}", {"v": "2", "part": "file"}
+        )
+
+    @override_settings(FILE_SENDFILE_BACKEND="nginx")
+    def test_nginx_serves_the_blob(self):
+        response = self.download()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response["X-Accel-Redirect"],
+            "/protected-media/" + os.path.relpath(self.blob_path, settings.MEDIA_ROOT),
+        )
+        self.assertEqual(response.content, b"")
+
+    def test_file_response_without_backend(self):
+        response = self.download()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Accel-Redirect", response)
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+        response.close()
+
+
+class UploadSessionTest(FileUploadTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.content = os.urandom(2500)
+
+    def create_session(self):
+        response = self.client.post(
+            "/api/files/uploads",
+            {
+                "file_metadata": json.dumps(
+                    {
+                        "name": "test.png",
+                        "mimetype": "image/png",
+                        "size": len(self.content),
+                        "hash": "h",
+                    }
+                ),
+                "size": len(self.content),
+            },
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, 201)
+
+        return response.data["session_id"]
+
+    def put_chunk(self, session_id, index, offset, data):
+        return self.client.put(
+            f"/api/files/uploads/{session_id}/chunks/{index}",
+            data,
+            content_type="application/octet-stream",
+            HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def upload_chunks(self, session_id, chunk_size=1000):
+        for index, offset in enumerate(range(0, len(self.content), chunk_size)):
+            response = self.put_chunk(
+                session_id, index, offset, self.content[offset : offset + chunk_size]
+            )
+            self.assertEqual(response.status_code, 200)
+
+        return response
+
+    def complete(self, session_id):
+        return self.client.post(
+            f"/api/files/uploads/{session_id}/complete",
+            {
+                "encryption_key_b64": base64.b64encode(b"k" * 32).decode("utf-8"),
+                "recipients": json.dumps([]),
+            },
+            format="multipart",
+        )
+
+    def test_chunked_upload(self):
+        session_id = self.create_session()
+        response = self.upload_chunks(session_id)
+
+        self.assertEqual(response.data["offset"], len(self.content))
+        self.assertEqual(response.data["next_chunk"], 3)
+
+        response = self.complete(session_id)
+        self.assertEqual(response.status_code, 201)
+
+        download = self.client.get(
+            f"/api/files/shared/{response.data['share_token']}",
+            {"v": "2", "part": "file"},
+        )
+        self.assertEqual(b"".join(download.streaming_content), self.content)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(os.listdir(settings.UPLOAD_STAGING_ROOT), [])
+
+    def test_chunk_at_wrong_offset(self):
+        session_id = self.create_session()
+        self.put_chunk(session_id, 0, 0, self.content[:1000])
+
+        for index, offset in [(1, 0), (0, 0), (2, 1000)]:
+            with self.subTest(index=index, offset=offset):
+                response = self.put_chunk(
+                    session_id, index, offset, self.content[offset : offset + 1000]
+                )
+
+                self.assertEqual(response.status_code, 409)
+                self.assertEqual(response.data["offset"], 1000)
+                self.assertEqual(response.data["next_chunk"], 1)
+
+    def test_complete_before_all_chunks(self):
+        session_id = self.create_session()
+        self.put_chunk(session_id, 0, 0, self.content[:1000])
+
+        response = self.complete(session_id)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["offset"], 1000)
+        self.assertFalse(File.objects.exists())
+
+    def test_complete_twice(self):
+        session_id = self.create_session()
+        self.upload_chunks(session_id)
+
+        self.assertEqual(self.complete(session_id).status_code, 201)
+        self.assertEqual(self.complete(session_id).status_code, 404)
+        self.assertEqual(File.objects.count(), 1)
@@ -1,10 +1,39 @@
+from django.conf import settings
 from django.urls import path
-from .views import FileUploadView, SharedFileAccessView
+from .async_views import AsyncFileUploadView, AsyncSharedFileAccessView
+from .views import (
+    FileUploadView,
+    SharedFileAccessView,
+    UploadSessionCreateView,
+    UploadSessionDetailView,
+    UploadSessionChunkView,
+    UploadSessionCompleteView,
+)
 
 app_name = "file_app"
 
+if settings.ASYNC_FILE_VIEWS:
+    FileUploadView = AsyncFileUploadView
+    SharedFileAccessView = AsyncSharedFileAccessView
+
 urlpatterns = [
     path("upload", FileUploadView.as_view(), name="file-upload"),
+    path("uploads", UploadSessionCreateView.as_view(), name="upload-session"),
+    path(
+        "uploads/<uuid:session_id>",
+        UploadSessionDetailView.as_view(),
+        name="upload-session-detail",
+    ),
+    path(
+        "uploads/<uuid:session_id>/chunks/<int:index>",
+        UploadSessionChunkView.as_view(),
+        name="upload-session-chunk",
+    ),
+    path(
+        "uploads/<uuid:session_id>/complete",
+        UploadSessionCompleteView.as_view(),
+        name="upload-session-complete",
+    ),
     path(
         "shared/<str:token>", SharedFileAccessView.as_view(), name="shared-file-access"
     ),
@@ -1,9 +1,62 @@
-import os, jwt
+import os, jwt, math, struct, hashlib, threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Iterator
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.primitives import hashes, serialization
+from django.conf import settings
 from django.utils import timezone
 
+from server.metrics import ENCRYPTED_BYTES, DECRYPTED_BYTES, RSA_WRAP_SECONDS
+
+# Streaming (segmented) AES-GCM layout used for files stored on the server:
+#   header  = segment size (4 bytes) + random nonce prefix (7 bytes)
+#   segment = AES-GCM(plaintext chunk) + 16 byte tag
+# Every segment is authenticated on its own with the nonce
+# `prefix + segment index (4 bytes) + last segment flag (1 byte)`, so segments
+# cannot be reordered, dropped or truncated without decryption failing.
+STREAM_HEADER = struct.Struct(">I7s")
+STREAM_TAG_SIZE = 16
+
+
+def get_flat_blob_path(name: str) -> str:
+    return os.path.join(settings.MEDIA_ROOT, name)
+
+
+def get_sharded_blob_path(name: str) -> str:
+    """
+    Path of a stored blob in the fan-out layout `MEDIA_ROOT/ab/cd/abcd<...>.enc`,
+    which keeps every directory small. Blob names start with random uuid hex.
+    """
+    return os.path.join(settings.MEDIA_ROOT, name[:2], name[2:4], name)
+
+
+def resolve_blob_path(name: str) -> str:
+    """
+    Path of an existing blob in either layout. Blobs stored before the fan-out
+    layout stay flat in MEDIA_ROOT until `manage.py shard_media` moves them.
+    """
+    sharded_path = get_sharded_blob_path(name)
+
+    if os.path.exists(sharded_path):
+        return sharded_path
+
+    flat_path = get_flat_blob_path(name)
+
+    if os.path.exists(flat_path):
+        return flat_path
+
+    # missing, or moved by `shard_media` between the two checks
+    return sharded_path
+
+
+def create_blob_path(name: str) -> str:
+    path = get_sharded_blob_path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    return path
+
 
 def get_server_key():
     key = os.environ.get("SERVER_FILE_ENCRYPTION_KEY")
@@ -15,6 +68,7 @@ def encrypt_data(data: bytes) -> tuple[bytes, bytes]:
     aesgcm = AESGCM(key)
     nonce = os.urandom(12)
     encrypted = aesgcm.encrypt(nonce, data, None)
+    ENCRYPTED_BYTES.labels("aesgcm").inc(len(data))
 
     return (nonce, encrypted)
 
@@ -23,23 +77,218 @@ def decrypt_data(nonce: bytes, encrypted_data: bytes) -> bytes:
     key = get_server_key()
     aesgcm = AESGCM(key)
 
-    return aesgcm.decrypt(nonce, encrypted_data, None)
+    data = aesgcm.decrypt(nonce, encrypted_data, None)
+    DECRYPTED_BYTES.labels("aesgcm").inc(len(data))
 
+    return data
 
-def encrypt_with_public_key(public_key_str: str, data: bytes) -> bytes:
-    public_key = serialization.load_pem_public_key(public_key_str.encode("utf-8"))
-    encrypted_data = public_key.encrypt(
-        data,
-        padding.OAEP(
-            mgf=padding.MGF1(algorithm=hashes.SHA256()),
-            algorithm=hashes.SHA256(),
-            label=None,
-        ),
-    )
+
+def _stream_nonce(prefix: bytes, index: int, last: bool) -> bytes:
+    return prefix + struct.pack(">IB", index, int(last))
+
+
+def _read_chunk(reader: BinaryIO, size: int) -> bytes:
+    chunk = b""
+
+    while len(chunk) < size:
+        data = reader.read(size - len(chunk))
+
+        if not data:
+            break
+
+        chunk += data
+
+    return chunk
+
+
+def encrypt_stream(reader: BinaryIO, segment_size: int = None) -> Iterator[bytes]:
+    """
+    Encrypt `reader` segment by segment, yielding the header followed by each
+    encrypted segment. Only two plaintext segments are held in memory at a time.
+    """
+    segment_size = segment_size or settings.FILE_ENCRYPTION_SEGMENT_SIZE
+    aesgcm = AESGCM(get_server_key())
+    prefix = os.urandom(7)
+
+    yield STREAM_HEADER.pack(segment_size, prefix)
+
+    index = 0
+    chunk = _read_chunk(reader, segment_size)
+
+    while True:
+        # read ahead by one segment to know if the current one is the last
+        next_chunk = _read_chunk(reader, segment_size)
+        last = not next_chunk
+
+        yield aesgcm.encrypt(_stream_nonce(prefix, index, last), chunk, None)
+        ENCRYPTED_BYTES.labels("aesgcm_stream").inc(len(chunk))
+
+        if last:
+            break
+
+        chunk = next_chunk
+        index += 1
+
+
+def _stream_segment_count(segment_size: int, file_size: int) -> int:
+    enc_segment_size = segment_size + STREAM_TAG_SIZE
+    return math.ceil((file_size - STREAM_HEADER.size) / enc_segment_size)
+
+
+def stream_plaintext_size(reader: BinaryIO, file_size: int) -> int:
+    """
+    Size of the plaintext of a file written by `encrypt_stream`, computed from
+    its header and `file_size` without decrypting anything.
+    """
+    segment_size, _ = STREAM_HEADER.unpack(reader.read(STREAM_HEADER.size))
+    segment_count = _stream_segment_count(segment_size, file_size)
+
+    return file_size - STREAM_HEADER.size - segment_count * STREAM_TAG_SIZE
+
+
+def decrypt_stream(reader: BinaryIO, file_size: int) -> Iterator[bytes]:
+    """
+    Decrypt a file written by `encrypt_stream`, yielding plaintext segments.
+    `file_size` is the size of the encrypted file including the header.
+    """
+    segment_size, prefix = STREAM_HEADER.unpack(reader.read(STREAM_HEADER.size))
+    enc_segment_size = segment_size + STREAM_TAG_SIZE
+    segment_count = _stream_segment_count(segment_size, file_size)
+    aesgcm = AESGCM(get_server_key())
+
+    for index in range(segment_count):
+        last = index == segment_count - 1
+        segment = reader.read(enc_segment_size)
+        chunk = aesgcm.decrypt(_stream_nonce(prefix, index, last), segment, None)
+        DECRYPTED_BYTES.labels("aesgcm_stream").inc(len(chunk))
+
+        yield chunk
+
+
+class PublicKeyCache:
+    """
+    Process local LRU cache of parsed public keys, keyed by user id and the
+    fingerprint of the PEM so that a changed key is never served stale.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int, public_key_str: str):
+        fingerprint = hashlib.sha256(public_key_str.encode("utf-8")).digest()
+        cache_key = (user_id, fingerprint)
+
+        with self._lock:
+            public_key = self._keys.get(cache_key)
+
+            if public_key is not None:
+                self._keys.move_to_end(cache_key)
+                self.hits += 1
+                return public_key
+
+            self.misses += 1
+
+        # parse outside of the lock, a concurrent miss at worst parses twice
+        public_key = serialization.load_pem_public_key(public_key_str.encode("utf-8"))
+
+        with self._lock:
+            self._keys[cache_key] = public_key
+            self._keys.move_to_end(cache_key)
+
+            while len(self._keys) > self.maxsize:
+                self._keys.popitem(last=False)
+
+        return public_key
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            for cache_key in [key for key in self._keys if key[0] == user_id]:
+                del self._keys[cache_key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._keys),
+                "maxsize": self.maxsize,
+            }
+
+
+public_key_cache = PublicKeyCache(settings.PUBLIC_KEY_CACHE_SIZE)
+
+
+def encrypt_with_public_key(
+    public_key_str: str, data: bytes, user_id: int = None
+) -> bytes:
+    if user_id is None:
+        public_key = serialization.load_pem_public_key(public_key_str.encode("utf-8"))
+    else:
+        public_key = public_key_cache.get(user_id, public_key_str)
+
+    with RSA_WRAP_SECONDS.time():
+        encrypted_data = public_key.encrypt(
+            data,
+            padding.OAEP(
+                mgf=padding.MGF1(algorithm=hashes.SHA256()),
+                algorithm=hashes.SHA256(),
+                label=None,
+            ),
+        )
 
     return encrypted_data
 
 
+_key_wrap_executors = {}
+_key_wrap_executors_lock = threading.Lock()
+
+
+def get_key_wrap_executor(workers: int) -> ThreadPoolExecutor:
+    with _key_wrap_executors_lock:
+        if workers not in _key_wrap_executors:
+            _key_wrap_executors[workers] = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="key-wrap"
+            )
+
+        return _key_wrap_executors[workers]
+
+
+def wrap_key_for_recipients(
+    recipients: list[tuple[int, str]], data: bytes, workers: int = None
+) -> list[bytes]:
+    """
+    Encrypt `data` with the public key of every (user id, public key) pair,
+    returning the results in the same order. Large recipient lists are split
+    into one batch per worker thread, the RSA operations release the GIL.
+    """
+    workers = workers or settings.KEY_WRAP_WORKERS
+
+    def wrap_batch(batch):
+        return [
+            encrypt_with_public_key(public_key_str, data, user_id=user_id)
+            for user_id, public_key_str in batch
+        ]
+
+    if workers <= 1 or len(recipients) < settings.KEY_WRAP_PARALLEL_THRESHOLD:
+        return wrap_batch(recipients)
+
+    batch_size = math.ceil(len(recipients) / workers)
+    batches = [
+        recipients[i : i + batch_size] for i in range(0, len(recipients), batch_size)
+    ]
+    executor = get_key_wrap_executor(workers)
+
+    return [
+        wrapped_key
+        for wrapped_keys in executor.map(wrap_batch, batches)
+        for wrapped_key in wrapped_keys
+    ]
+
+
 def decrypt_with_private_key(private_key_str: str, encrypted_data: bytes) -> bytes:
     private_key = serialization.load_pem_private_key(
         private_key_str.encode("utf-8"), password=None
@@ -57,6 +306,78 @@ def decrypt_with_private_key(private_key_str: str, encrypted_data: bytes) -> byt
     return decrypted_data
 
 
+def decrypt_stream_range(
+    reader: BinaryIO, file_size: int, start: int, end: int
+) -> Iterator[bytes]:
+    """
+    Decrypt only the plaintext bytes `start` to `end` (inclusive) of a file
+    written by `encrypt_stream`. Only the segments covering the range are read.
+    """
+    segment_size, prefix = STREAM_HEADER.unpack(reader.read(STREAM_HEADER.size))
+    enc_segment_size = segment_size + STREAM_TAG_SIZE
+    segment_count = _stream_segment_count(segment_size, file_size)
+    first_index, last_index = start // segment_size, end // segment_size
+    aesgcm = AESGCM(get_server_key())
+
+    reader.seek(STREAM_HEADER.size + first_index * enc_segment_size)
+
+    for index in range(first_index, last_index + 1):
+        last = index == segment_count - 1
+        segment = reader.read(enc_segment_size)
+        chunk = aesgcm.decrypt(_stream_nonce(prefix, index, last), segment, None)
+        DECRYPTED_BYTES.labels("aesgcm_stream").inc(len(chunk))
+
+        offset = index * segment_size
+        yield chunk[max(start - offset, 0) : end - offset + 1]
+
+
+def parse_range_header(range_header: str, size: int) -> tuple[int, int] | None:
+    """
+    Parse a single `bytes=` range into inclusive (start, end) offsets. Returns
+    None when the header should be ignored (malformed or multiple ranges) and
+    raises ValueError when the range cannot be satisfied.
+    """
+    unit, _, ranges = range_header.partition("=")
+
+    if unit.strip() != "bytes" or "," in ranges:
+        return None
+
+    first, sep, last = ranges.strip().partition("-")
+
+    if not sep or not (first.isdigit() or last.isdigit()):
+        return None
+
+    if not first:
+        # suffix range, the last `last` bytes
+        suffix = int(last)
+
+        if suffix == 0 or size == 0:
+            raise ValueError("Unsatisfiable range.")
+
+        return max(size - suffix, 0), size - 1
+
+    start = int(first)
+    end = int(last) if last.isdigit() else size - 1
+
+    if start >= size:
+        raise ValueError("Unsatisfiable range.")
+
+    if end < start:
+        return None
+
+    return start, min(end, size - 1)
+
+
+def multipart_part_header(
+    boundary: str, name: str, filename: str, content_type: str
+) -> bytes:
+    return (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode("utf-8")
+
+
 def generate_share_jwt(file_id: int):
     secret_key = os.environ.get("AUTH_JWT_SECRET_KEY")
     exp = timezone.now() + timezone.timedelta(minutes=30)
@@ -1,33 +1,202 @@
-import os, uuid, base64, jwt, json, traceback
+import os, uuid, base64, jwt, shutil, traceback
+from urllib.parse import quote
 
 from requests_toolbelt.multipart.encoder import MultipartEncoder
 
 from django.conf import settings
 from django.utils import timezone
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from django.db import transaction
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 
+from server.metrics import FILE_UPLOAD_BYTES, FILE_DOWNLOAD_BYTES
 from auth_app.permissions import IsAdminOrRegularUser, IsActive
 from auth_app.models import User
-from .models import File, FileShare
-from .serializers import FileUploadSerializer
+from .models import File, FileShare, UploadSession
+from .serializers import (
+    FileUploadSerializer,
+    ShareRecipientsSerializer,
+    UploadSessionSerializer,
+)
+from .idempotency import (
+    IDEMPOTENCY_KEY_MAX_LENGTH,
+    IdempotencyKeyInUse,
+    IdempotencyKeyMismatch,
+    fingerprint_request,
+    reserve_idempotency_key,
+    complete_idempotency_key,
+    release_idempotency_key,
+)
+from .share_access import get_share_access
+from .storage import get_blob_storage
 from .utils import (
-    encrypt_data,
+    encrypt_stream,
+    decrypt_stream,
+    decrypt_stream_range,
     decrypt_data,
-    encrypt_with_public_key,
+    stream_plaintext_size,
+    parse_range_header,
+    wrap_key_for_recipients,
+    multipart_part_header,
     generate_share_jwt,
 )
 
+# bytes read at a time from blobs that are served as they are stored
+BLOB_CHUNK_SIZE = 256 * 1024
+
+
+def store_blob(unique_filename, reader):
+    """
+    Write the client side encrypted upload in `reader` to storage, wrapped in
+    the server side encryption of `FILE_STORAGE_ENCRYPTION_SCHEME`. Returns the
+    scheme the blob was stored with.
+    """
+    with get_blob_storage().open(unique_filename, "wb") as f:
+        if settings.FILE_STORAGE_ENCRYPTION_SCHEME == "none":
+            shutil.copyfileobj(reader, f, BLOB_CHUNK_SIZE)
+            return "none"
+
+        # Server-side encryption, streamed segment by segment to storage
+        for segment in encrypt_stream(reader):
+            f.write(segment)
+
+    return "aesgcm_stream"
+
+
+def create_file_with_shares(
+    owner,
+    unique_filename,
+    file_metadata,
+    encryption_key_b64,
+    recipients_data,
+    encryption_scheme="aesgcm_stream",
+):
+    """
+    Create the `File` record of an encrypted blob already written to
+    storage along with a `FileShare` for every recipient and the owner.
+    Returns the share token and its expiry.
+    """
+    # one query for all recipients, the first entry wins for duplicate emails
+    rcp_by_email = {}
+
+    for rcp in recipients_data:
+        rcp_by_email.setdefault(rcp.get("email"), rcp)
+
+    recipients = (
+        User.objects.filter(email__in=rcp_by_email.keys())
+        .exclude(id=owner.id)
+        .exclude(public_key__isnull=True)
+        .exclude(public_key="")
+        .only("id", "email", "public_key")
+    )
+
+    # (recipient, can_view, can_download), the owner can always view and download
+    share_targets = []
+
+    for recipient in recipients:
+        rcp = rcp_by_email[recipient.email]
+        rcp_can_view = rcp.get("can_view", True)
+        rcp_can_download = rcp.get("can_download", False)
+
+        if rcp_can_download:
+            rcp_can_view = True
+
+        share_targets.append((recipient, rcp_can_view, rcp_can_download))
+
+    if owner.public_key:
+        share_targets.append((owner, True, True))
+
+    # wrap the file key before taking the write lock
+    encrypted_keys = [
+        base64.b64encode(encrypted_key).decode("utf-8")
+        for encrypted_key in wrap_key_for_recipients(
+            [(recipient.id, recipient.public_key) for recipient, _, _ in share_targets],
+            encryption_key_b64,
+        )
+    ]
+
+    expires_at = timezone.now() + timezone.timedelta(minutes=30)
+
+    with transaction.atomic():
+        f_obj = File.objects.create(
+            owner=owner,
+            server_enc_file_name=unique_filename,
+            file_metadata=file_metadata,
+            encryption_scheme=encryption_scheme,
+        )
+
+        FileShare.objects.bulk_create(
+            [
+                FileShare(
+                    file=f_obj,
+                    recipient=recipient,
+                    encrypted_file_key=encrypted_key,
+                    can_view=can_view,
+                    can_download=can_download,
+                    expires_at=expires_at,
+                )
+                for (recipient, can_view, can_download), encrypted_key in zip(
+                    share_targets, encrypted_keys
+                )
+            ]
+        )
+
+        # Generate a single share token which can be used by all the recipients
+        return generate_share_jwt(f_obj.id)
+
 
 class FileUploadView(APIView):
     permission_classes = [IsAdminOrRegularUser]
 
     def post(self, request):
-        file_path = None
+        idempotency_key = request.headers.get("Idempotency-Key")
+
+        if idempotency_key is None:
+            return self.upload(request)
+
+        if not idempotency_key or len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return Response(
+                {"message": "Invalid Idempotency-Key header."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # a retry is answered before its body is validated or stored
+        try:
+            record, created = reserve_idempotency_key(
+                request.user, idempotency_key, fingerprint_request(request)
+            )
+        except IdempotencyKeyInUse:
+            return Response(
+                {"message": "A request with this Idempotency-Key is in progress."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        except IdempotencyKeyMismatch:
+            return Response(
+                {"message": "This Idempotency-Key was used for a different request."},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+
+        if not created:
+            response = Response(record.response_body, status=record.response_status)
+            response["Idempotent-Replayed"] = "true"
+
+            return response
+
+        try:
+            response = self.upload(request)
+        except BaseException:
+            release_idempotency_key(record)
+            raise
+
+        complete_idempotency_key(record, response)
+
+        return response
+
+    def upload(self, request):
+        unique_filename = None
 
         try:
             serializer = FileUploadSerializer(data=request.data)
@@ -44,207 +213,662 @@ class FileUploadView(APIView):
             uploaded_file = serializer.validated_data["file"]
             encryption_key_b64 = serializer.validated_data["encryption_key_b64"]
             file_metadata = serializer.validated_data["file_metadata"]
-            recipients_data = serializer.validated_data["recipients"]
+            recipients_data = serializer.validated_data.get("recipients", [])
+
+            unique_filename = f"{uuid.uuid4().hex}.enc"
+            encryption_scheme = store_blob(unique_filename, uploaded_file)
+
+            token, token_exp_at = create_file_with_shares(
+                request.user,
+                unique_filename,
+                file_metadata,
+                encryption_key_b64,
+                recipients_data,
+                encryption_scheme,
+            )
+            FILE_UPLOAD_BYTES.observe(uploaded_file.size)
+
+            return Response(
+                {
+                    "message": "File uploaded and shares created successfully.",
+                    "share_token": token,
+                    "token_exp_at": token_exp_at,
+                },
+                status=status.HTTP_201_CREATED,
+            )
+        except Exception as e:
+            traceback.print_exc()
+
+            if unique_filename is not None:
+                get_blob_storage().delete(unique_filename)
 
-            file_content = uploaded_file.read()
+            return Response(
+                {"message": "Something went wrong.", "stack": str(e)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-            # Server-side encryption
-            nonce, encrypted_data = encrypt_data(file_content)
-            combined_data = nonce + encrypted_data
 
-            unique_filename = f"{uuid.uuid4().hex}.enc"
-            file_path = os.path.join(settings.MEDIA_ROOT, unique_filename)
+def iter_blob(fd, length=None):
+    while length is None or length > 0:
+        chunk = fd.read(
+            BLOB_CHUNK_SIZE if length is None else min(length, BLOB_CHUNK_SIZE)
+        )
 
-            with open(file_path, "wb") as f:
-                f.write(combined_data)
+        if not chunk:
+            return
 
-            with transaction.atomic():
-                f_obj = File.objects.create(
-                    owner=request.user,
-                    server_enc_file_name=unique_filename,
-                    file_metadata=file_metadata,
+        if length is not None:
+            length -= len(chunk)
+
+        yield chunk
+
+
+def get_blob_size(fd):
+    size = fd.seek(0, os.SEEK_END)
+    fd.seek(0)
+
+    return size
+
+
+def get_decrypted_file_size(f_obj):
+    storage = get_blob_storage()
+
+    if f_obj.encryption_scheme == "none":
+        return storage.size(f_obj.server_enc_file_name)
+
+    if f_obj.encryption_scheme == "aesgcm":
+        # 12 byte nonce + ciphertext + 16 byte tag
+        return storage.size(f_obj.server_enc_file_name) - 12 - 16
+
+    with storage.open(f_obj.server_enc_file_name) as fd:
+        return stream_plaintext_size(fd, get_blob_size(fd))
+
+
+def iter_decrypted_file(f_obj):
+    with get_blob_storage().open(f_obj.server_enc_file_name) as fd:
+        if f_obj.encryption_scheme == "none":
+            yield from iter_blob(fd)
+        elif f_obj.encryption_scheme == "aesgcm":
+            combined_data = fd.read()
+            yield decrypt_data(combined_data[:12], combined_data[12:])
+        else:
+            yield from decrypt_stream(fd, get_blob_size(fd))
+
+
+def record_download(response):
+    """
+    Observe the size of a shared file response, known from its Content-Length
+    or its content. Hand offs through `X-Accel-Redirect` are sent by nginx.
+    """
+    if response.status_code not in (200, 206) or "X-Accel-Redirect" in response:
+        return response
+
+    if "Content-Length" in response:
+        FILE_DOWNLOAD_BYTES.observe(int(response["Content-Length"]))
+    elif not response.streaming:
+        FILE_DOWNLOAD_BYTES.observe(len(response.content))
+
+    return response
+
+
+def range_not_satisfiable(file_size):
+    response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+    response["Content-Range"] = f"bytes */{file_size}"
+
+    return response
+
+
+class SharedFileAccessView(APIView):
+    # Authenticated users only
+    permission_classes = [IsActive]
+    read_replica = True
+
+    def stream_multipart(self, f_obj, share_permission_data, file_metadata):
+        boundary = uuid.uuid4().hex
+        preamble = (
+            multipart_part_header(
+                boundary, "permissions", "permissions.json", "application/json"
+            )
+            + share_permission_data.encode("utf-8")
+            + b"\r\n"
+            + multipart_part_header(
+                boundary, "metadata", "metadata.json", "application/json"
+            )
+            + file_metadata.encode("utf-8")
+            + b"\r\n"
+            + multipart_part_header(
+                boundary,
+                "file",
+                f_obj.server_enc_file_name,
+                "application/octet-stream",
+            )
+        )
+        epilogue = f"\r\n--{boundary}--\r\n".encode("utf-8")
+        file_size = get_decrypted_file_size(f_obj)
+
+        def body():
+            yield preamble
+            yield from iter_decrypted_file(f_obj)
+            yield epilogue
+
+        response = StreamingHttpResponse(
+            body(), content_type=f"multipart/form-data; boundary={boundary}"
+        )
+        response["Content-Length"] = len(preamble) + file_size + len(epilogue)
+        response.status_code = status.HTTP_200_OK
+
+        return response
+
+    def send_file(self, f_obj, range_header):
+        """
+        Serve a blob stored without server side encryption as is. Local blobs
+        are handed to nginx through `X-Accel-Redirect`, which also serves the
+        ranges, or to the WSGI server's `sendfile` through `FileResponse`.
+        """
+        storage = get_blob_storage()
+        file_path = storage.path(f_obj.server_enc_file_name)
+
+        if file_path is not None and settings.FILE_SENDFILE_BACKEND == "nginx":
+            response = HttpResponse(content_type="application/octet-stream")
+            response["X-Accel-Redirect"] = (
+                settings.FILE_SENDFILE_NGINX_LOCATION
+                + quote(os.path.relpath(file_path, settings.MEDIA_ROOT))
+            )
+
+            return response
+
+        file_size = storage.size(f_obj.server_enc_file_name)
+        byte_range = None
+
+        if range_header:
+            try:
+                byte_range = parse_range_header(range_header, file_size)
+            except ValueError:
+                return range_not_satisfiable(file_size)
+
+        if byte_range is None:
+            if file_path is not None:
+                response = FileResponse(
+                    open(file_path, "rb"), content_type="application/octet-stream"
                 )
+            else:
+                response = StreamingHttpResponse(
+                    iter_decrypted_file(f_obj), content_type="application/octet-stream"
+                )
+                response["Content-Length"] = file_size
 
-                expires_at = timezone.now() + timezone.timedelta(minutes=30)
+            response["Accept-Ranges"] = "bytes"
 
-                for rcp in recipients_data:
-                    email = rcp.get("email")
-                    rcp_can_view = rcp.get("can_view", True)
-                    rcp_can_download = rcp.get("can_download", False)
+            return response
 
-                    if rcp_can_download:
-                        rcp_can_view = True
+        start, end = byte_range
 
-                    try:
-                        recipient = User.objects.get(email=email)
-                    except User.DoesNotExist:
-                        continue
+        def body():
+            with storage.open(f_obj.server_enc_file_name) as fd:
+                fd.seek(start)
+                yield from iter_blob(fd, end - start + 1)
 
-                    if not recipient.public_key:
-                        continue
+        response = StreamingHttpResponse(
+            body(), content_type="application/octet-stream"
+        )
+        response["Content-Length"] = end - start + 1
+        response["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+        response["Accept-Ranges"] = "bytes"
+        response.status_code = status.HTTP_206_PARTIAL_CONTENT
 
-                    enc_key_for_recipient_binary = encrypt_with_public_key(
-                        recipient.public_key, encryption_key_b64
-                    )
-                    enc_key_for_recipient = base64.b64encode(
-                        enc_key_for_recipient_binary
-                    ).decode("utf-8")
-
-                    FileShare.objects.create(
-                        file=f_obj,
-                        recipient=recipient,
-                        encrypted_file_key=enc_key_for_recipient,
-                        can_view=rcp_can_view,
-                        can_download=rcp_can_download,
-                        expires_at=expires_at,
-                    )
+        return response
 
-                if request.user.public_key:
-                    owner_enc_key_binary = encrypt_with_public_key(
-                        request.user.public_key, encryption_key_b64
-                    )
-                    owner_enc_key = base64.b64encode(owner_enc_key_binary).decode(
-                        "utf-8"
-                    )
+    def stream_file(self, f_obj, range_header):
+        if f_obj.encryption_scheme == "none":
+            return self.send_file(f_obj, range_header)
 
-                    FileShare.objects.create(
-                        file=f_obj,
-                        recipient=request.user,
-                        encrypted_file_key=owner_enc_key,
-                        can_view=True,
-                        can_download=True,
-                        expires_at=expires_at,
-                    )
+        file_size = get_decrypted_file_size(f_obj)
+
+        # only the segmented layout can be decrypted from an arbitrary offset
+        if f_obj.encryption_scheme == "aesgcm" or not range_header:
+            response = StreamingHttpResponse(
+                iter_decrypted_file(f_obj),
+                content_type="application/octet-stream",
+            )
+            response["Content-Length"] = file_size
+            response["Accept-Ranges"] = (
+                "none" if f_obj.encryption_scheme == "aesgcm" else "bytes"
+            )
+            response.status_code = status.HTTP_200_OK
+
+            return response
+
+        try:
+            byte_range = parse_range_header(range_header, file_size)
+        except ValueError:
+            return range_not_satisfiable(file_size)
+
+        if byte_range is None:
+            return self.stream_file(f_obj, None)
+
+        start, end = byte_range
+
+        def body():
+            with get_blob_storage().open(f_obj.server_enc_file_name) as fd:
+                yield from decrypt_stream_range(fd, get_blob_size(fd), start, end)
+
+        response = StreamingHttpResponse(
+            body(), content_type="application/octet-stream"
+        )
+        response["Content-Length"] = end - start + 1
+        response["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+        response["Accept-Ranges"] = "bytes"
+        response.status_code = status.HTTP_206_PARTIAL_CONTENT
+
+        return response
+
+    def decode_token(self, token):
+        """
+        The file id of a share token, or the error response for a bad token.
+        """
+        secret_key = os.environ.get("AUTH_JWT_SECRET_KEY")
+
+        try:
+            payload = jwt.decode(token, secret_key, algorithms=["HS256"])
+        except jwt.ExpiredSignatureError:
+            return None, Response(
+                {"message": "Link expired."}, status=status.HTTP_403_FORBIDDEN
+            )
+        except jwt.InvalidTokenError:
+            return None, Response(
+                {"message": "Invalid link."}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return payload.get("file_id"), None
+
+    def check_share(self, share):
+        """
+        The error response when `share` does not allow viewing the file.
+        """
+        if share is None:
+            return Response(
+                {"message": "You do not have permission to access this file."},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        # Check expiration
+        if share.expires_at < timezone.now():
+            return Response(
+                {"message": "Link expired."}, status=status.HTTP_403_FORBIDDEN
+            )
+
+        if not share.can_view:
+            return Response(
+                {"message": "View not allowed."}, status=status.HTTP_403_FORBIDDEN
+            )
+
+        return None
+
+    def respond(self, request, share):
+        """
+        The file response for an allowed share. Reads blobs but makes no queries.
+        """
+        f_obj = share.file
+
+        if not get_blob_storage().exists(f_obj.server_enc_file_name):
+            return Response(
+                {"message": "File missing on server."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        # v2 raw file bytes, with support for seeking through `Range`
+        if (
+            request.query_params.get("v") == "2"
+            and request.query_params.get("part") == "file"
+        ):
+            return self.stream_file(f_obj, request.headers.get("Range"))
+
+        file_metadata = share.file_metadata
+        share_permission_data = share.share_permission_data
+
+        # v2 streams the file as a raw binary part instead of base64
+        if request.query_params.get("v") == "2":
+            return self.stream_multipart(f_obj, share_permission_data, file_metadata)
+
+        decrypted_data = b"".join(iter_decrypted_file(f_obj))
+        decypted_data_b64 = base64.b64encode(decrypted_data).decode("utf-8")
+
+        multipart_body = MultipartEncoder(
+            fields={
+                "permissions": (
+                    "permissions.json",
+                    share_permission_data,
+                    "application/json",
+                ),
+                "metadata": (
+                    "metadata.json",
+                    file_metadata,
+                    "application/json",
+                ),
+                "file": (
+                    f_obj.server_enc_file_name,
+                    decypted_data_b64,
+                    "application/octet-stream",
+                ),
+            }
+        )
+
+        response = HttpResponse(
+            multipart_body.to_string(),
+            content_type=multipart_body.content_type,
+        )
 
-                # Generate a single share token which can be used by all the recipients
-                token, token_exp_at = generate_share_jwt(f_obj.id)
+        response.status_code = status.HTTP_200_OK
+
+        return response
+
+    def get(self, request, token):
+        try:
+            file_id, error = self.decode_token(token)
+
+            if error is not None:
+                return error
+
+            # Check if this user is a recipient in FileShare
+            share = get_share_access(file_id, request.user)
+            error = self.check_share(share)
+
+            if error is not None:
+                return error
+
+            return record_download(self.respond(request, share))
+        except Exception as e:
+            traceback.print_exc()
+            return Response(
+                {"message": "Something went wrong.", "stack": str(e)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+
+def get_upload_session(request, session_id):
+    return UploadSession.objects.filter(
+        id=session_id, owner=request.user, expires_at__gt=timezone.now()
+    ).first()
+
+
+def get_formatted_upload_session(session):
+    return {
+        "session_id": session.id,
+        "size": session.size,
+        "offset": session.received_bytes,
+        "next_chunk": session.next_chunk,
+        "expires_at": session.expires_at.isoformat(),
+    }
+
+
+"""
+resumable uploads happen in three steps:
+1. POST   uploads                               -> create a session
+2. PUT    uploads/<session_id>/chunks/<index>   -> append a chunk at `Upload-Offset`
+3. POST   uploads/<session_id>/complete         -> encrypt the file and create the shares
+after a dropped connection, GET uploads/<session_id> tells where to resume from
+"""
+
+
+class UploadSessionCreateView(APIView):
+    permission_classes = [IsAdminOrRegularUser]
+
+    def post(self, request):
+        try:
+            serializer = UploadSessionSerializer(data=request.data)
+
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+            open_sessions = UploadSession.objects.filter(
+                owner=request.user, expires_at__gt=timezone.now()
+            ).count()
+
+            # a soft limit, concurrent requests may each see room for one more
+            if open_sessions >= settings.UPLOAD_SESSION_MAX_OPEN_PER_USER:
+                return Response(
+                    {"message": "Too many unfinished uploads, complete or cancel one."},
+                    status=status.HTTP_429_TOO_MANY_REQUESTS,
+                )
+
+            session = UploadSession.objects.create(
+                owner=request.user,
+                file_metadata=serializer.validated_data["file_metadata"],
+                size=serializer.validated_data["size"],
+                expires_at=timezone.now()
+                + timezone.timedelta(minutes=settings.UPLOAD_SESSION_TTL_IN_MINS),
+            )
+
+            os.makedirs(settings.UPLOAD_STAGING_ROOT, exist_ok=True)
+            open(session.get_staging_path(), "wb").close()
 
             return Response(
                 {
-                    "message": "File uploaded and shares created successfully.",
-                    "share_token": token,
-                    "token_exp_at": token_exp_at,
+                    "message": "Upload session created.",
+                    "chunk_size_limit": settings.UPLOAD_CHUNK_SIZE_LIMIT_IN_MB
+                    * 1024
+                    * 1024,
+                    **get_formatted_upload_session(session),
                 },
                 status=status.HTTP_201_CREATED,
             )
         except Exception as e:
             traceback.print_exc()
-
-            if (file_path is not None) and (os.path.exists(file_path)):
-                os.remove(file_path)
-
             return Response(
                 {"message": "Something went wrong.", "stack": str(e)},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
 
-class SharedFileAccessView(APIView):
-    # Authenticated users only
-    permission_classes = [IsActive]
+class UploadSessionDetailView(APIView):
+    permission_classes = [IsAdminOrRegularUser]
 
-    def get(self, request, token):
+    def get(self, request, session_id):
+        session = get_upload_session(request, session_id)
+
+        if not session:
+            return Response(
+                {"message": "Upload session not found."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        return Response(
+            {"message": "Ok", **get_formatted_upload_session(session)},
+            status=status.HTTP_200_OK,
+        )
+
+    def delete(self, request, session_id):
+        session = get_upload_session(request, session_id)
+
+        if not session:
+            return Response(
+                {"message": "Upload session not found."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        session.delete()
+
+        if os.path.exists(session.get_staging_path()):
+            os.remove(session.get_staging_path())
+
+        return Response(
+            {"message": "Upload session cancelled."}, status=status.HTTP_200_OK
+        )
+
+
+class UploadSessionChunkView(APIView):
+    permission_classes = [IsAdminOrRegularUser]
+
+    def put(self, request, session_id, index):
         try:
-            secret_key = os.environ.get("AUTH_JWT_SECRET_KEY")
+            session = get_upload_session(request, session_id)
+
+            if not session:
+                return Response(
+                    {"message": "Upload session not found."},
+                    status=status.HTTP_404_NOT_FOUND,
+                )
 
             try:
-                payload = jwt.decode(token, secret_key, algorithms=["HS256"])
-            except jwt.ExpiredSignatureError:
+                offset = int(request.headers.get("Upload-Offset", ""))
+                chunk_size = int(request.headers.get("Content-Length", ""))
+            except ValueError:
                 return Response(
-                    {"message": "Link expired."}, status=status.HTTP_403_FORBIDDEN
+                    {"message": "Upload-Offset and Content-Length are required."},
+                    status=status.HTTP_400_BAD_REQUEST,
                 )
-            except jwt.InvalidTokenError:
+
+            # chunks have to arrive in order, the client resumes from the session offset
+            if index != session.next_chunk or offset != session.received_bytes:
                 return Response(
-                    {"message": "Invalid link."}, status=status.HTTP_400_BAD_REQUEST
+                    {
+                        "message": "Chunk does not match the session offset.",
+                        **get_formatted_upload_session(session),
+                    },
+                    status=status.HTTP_409_CONFLICT,
                 )
 
-            file_id = payload.get("file_id")
+            max_chunk_size = settings.UPLOAD_CHUNK_SIZE_LIMIT_IN_MB * 1024 * 1024
 
-            # Check if this user is a recipient in FileShare
-            try:
-                share = FileShare.objects.select_related("file__owner").get(
-                    file__id=file_id, recipient=request.user
+            if chunk_size <= 0 or chunk_size > max_chunk_size:
+                return Response(
+                    {"message": "Invalid chunk size."},
+                    status=status.HTTP_400_BAD_REQUEST,
                 )
-            except FileShare.DoesNotExist:
+
+            if offset + chunk_size > session.size:
                 return Response(
-                    {"message": "You do not have permission to access this file."},
-                    status=status.HTTP_403_FORBIDDEN,
+                    {"message": "Chunk exceeds the declared file size."},
+                    status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            # Check expiration
-            if share.expires_at < timezone.now():
+            written = 0
+
+            # a chunk that was only partly written before is simply overwritten
+            with open(session.get_staging_path(), "r+b") as f:
+                f.seek(offset)
+
+                while written < chunk_size:
+                    data = request.stream.read(min(64 * 1024, chunk_size - written))
+
+                    if not data:
+                        break
+
+                    f.write(data)
+                    written += len(data)
+
+                f.truncate()
+
+            if written != chunk_size:
                 return Response(
-                    {"message": "Link expired."}, status=status.HTTP_403_FORBIDDEN
+                    {"message": "Incomplete chunk received."},
+                    status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            if not share.can_view:
+            # conditional update so that concurrent retries of a chunk are applied once
+            updated = UploadSession.objects.filter(
+                id=session.id, next_chunk=index, received_bytes=offset
+            ).update(next_chunk=index + 1, received_bytes=offset + written)
+
+            if not updated:
+                session.refresh_from_db()
+
                 return Response(
-                    {"message": "View not allowed."}, status=status.HTTP_403_FORBIDDEN
+                    {
+                        "message": "Chunk does not match the session offset.",
+                        **get_formatted_upload_session(session),
+                    },
+                    status=status.HTTP_409_CONFLICT,
                 )
 
-            f_obj = share.file
-            file_path = f_obj.get_full_path()
+            session.next_chunk = index + 1
+            session.received_bytes = offset + written
+
+            return Response(
+                {"message": "Chunk received.", **get_formatted_upload_session(session)},
+                status=status.HTTP_200_OK,
+            )
+        except Exception as e:
+            traceback.print_exc()
+            return Response(
+                {"message": "Something went wrong.", "stack": str(e)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+
+class UploadSessionCompleteView(APIView):
+    permission_classes = [IsAdminOrRegularUser]
+
+    def post(self, request, session_id):
+        unique_filename = None
 
-            if not os.path.exists(file_path):
+        try:
+            serializer = ShareRecipientsSerializer(data=request.data)
+
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+            session = get_upload_session(request, session_id)
+
+            if not session:
                 return Response(
-                    {"message": "File missing on server."},
+                    {"message": "Upload session not found."},
                     status=status.HTTP_404_NOT_FOUND,
                 )
 
-            with open(file_path, "rb") as fd:
-                combined_data = fd.read()
+            if session.received_bytes != session.size:
+                return Response(
+                    {
+                        "message": "Upload is not complete yet.",
+                        **get_formatted_upload_session(session),
+                    },
+                    status=status.HTTP_409_CONFLICT,
+                )
 
-            permissions_data = {
-                "can_view": share.can_view,
-                "can_download": share.can_download,
-                "expires_at": share.expires_at.isoformat(),
-                "encrypted_file_key": share.encrypted_file_key,
-            }
+            unique_filename = f"{uuid.uuid4().hex}.enc"
 
-            metadata = f_obj.file_metadata
-            metadata["owner"] = {
-                "name": f_obj.owner.name,
-                "username": f_obj.owner.username,
-            }
+            with open(session.get_staging_path(), "rb") as staged:
+                encryption_scheme = store_blob(unique_filename, staged)
 
-            nonce = combined_data[:12]
-            encrypted_data = combined_data[12:]
-            decrypted_data = decrypt_data(nonce, encrypted_data)
-
-            file_metadata = json.dumps(metadata, ensure_ascii=False)
-            share_permission_data = json.dumps(permissions_data, ensure_ascii=False)
-            decypted_data_b64 = base64.b64encode(decrypted_data).decode("utf-8")
-
-            multipart_body = MultipartEncoder(
-                fields={
-                    "permissions": (
-                        "permissions.json",
-                        share_permission_data,
-                        "application/json",
-                    ),
-                    "metadata": (
-                        "metadata.json",
-                        file_metadata,
-                        "application/json",
-                    ),
-                    "file": (
-                        f_obj.server_enc_file_name,
-                        decypted_data_b64,
-                        "application/octet-stream",
-                    ),
-                }
-            )
-
-            response = HttpResponse(
-                multipart_body.to_string(),
-                content_type=multipart_body.content_type,
-            )
+            with transaction.atomic():
+                # only one of several concurrent completions of a session wins
+                deleted, _ = UploadSession.objects.filter(id=session.id).delete()
+
+                if deleted:
+                    token, token_exp_at = create_file_with_shares(
+                        request.user,
+                        unique_filename,
+                        session.file_metadata,
+                        serializer.validated_data["encryption_key_b64"],
+                        serializer.validated_data.get("recipients", []),
+                        encryption_scheme,
+                    )
 
-            response.status_code = status.HTTP_200_OK
+            if not deleted:
+                get_blob_storage().delete(unique_filename)
 
-            return response
+                return Response(
+                    {"message": "Upload session already completed."},
+                    status=status.HTTP_409_CONFLICT,
+                )
+
+            os.remove(session.get_staging_path())
+            FILE_UPLOAD_BYTES.observe(session.size)
+
+            return Response(
+                {
+                    "message": "File uploaded and shares created successfully.",
+                    "share_token": token,
+                    "token_exp_at": token_exp_at,
+                },
+                status=status.HTTP_201_CREATED,
+            )
         except Exception as e:
             traceback.print_exc()
+
+            if unique_filename is not None:
+                get_blob_storage().delete(unique_filename)
+
             return Response(
                 {"message": "Something went wrong.", "stack": str(e)},
                 status=status.HTTP_400_BAD_REQUEST,
@@ -12,5 +12,11 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'server.settings')
+# file transfers are served by the async views under ASGI, see ASYNC_FILE_VIEWS
+os.environ.setdefault('ASYNC_FILE_VIEWS', 'True')
 
 application = get_asgi_application()
+
+from file_app.reaper import start_periodic_reaper
+
+start_periodic_reaper()
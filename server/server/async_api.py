@@ -0,0 +1,68 @@
+import inspect
+
+from asgiref.sync import sync_to_async
+from rest_framework.views import APIView
+
+
+class AsyncAPIView(APIView):
+    """
+    APIView whose handlers are coroutines, served on the event loop under ASGI.
+    Authentication, permission checks and exception handling run as in APIView,
+    authentication on a thread since it looks the user up in the database.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(
+                    self, request.method.lower(), self.http_method_not_allowed
+                )
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+
+            if inspect.isawaitable(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+
+        return self.response
+
+    async def options(self, request, *args, **kwargs):
+        return super().options(request, *args, **kwargs)
+
+
+async def iterate_in_thread(iterator):
+    """
+    Async iterator over a blocking `iterator`, each item is produced on a thread
+    of the default executor so the event loop stays free in the meantime.
+    """
+    iterator = iter(iterator)
+    done = object()
+    get_next = sync_to_async(next, thread_sensitive=False)
+
+    while (item := await get_next(iterator, done)) is not done:
+        yield item
+
+
+def stream_in_thread(response):
+    """
+    Swap the body of a streaming response for an async iterator. Under ASGI,
+    Django buffers the whole body of a synchronously iterated response first.
+    The original iterator is still closed along with the response.
+    """
+    if response.streaming:
+        response.streaming_content = iterate_in_thread(response.streaming_content)
+
+    return response
@@ -0,0 +1,76 @@
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICA_DB_ALIAS = "replica"
+
+_read_from_replica = ContextVar("read_from_replica", default=False)
+
+
+def reading_from_replica():
+    return _read_from_replica.get() and REPLICA_DB_ALIAS in settings.DATABASES
+
+
+class ReadReplicaRouter:
+    """
+    Sends reads to the replica while a view marked with `read_replica = True`
+    handles a safe request. Everything else, including every write, uses the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if reading_from_replica():
+            return REPLICA_DB_ALIAS
+
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # schema changes reach the replica through replication
+        return db != REPLICA_DB_ALIAS
+
+
+class ReadReplicaMiddleware:
+    # async capable so async views under ASGI need no thread for the middleware
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        try:
+            return self.get_response(request)
+        finally:
+            _read_from_replica.set(False)
+
+    async def __acall__(self, request):
+        try:
+            return await self.get_response(request)
+        finally:
+            _read_from_replica.set(False)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, "view_class", None)
+
+        if getattr(view_class, "read_replica", False) and request.method in (
+            "GET",
+            "HEAD",
+            "OPTIONS",
+        ):
+            _read_from_replica.set(True)
@@ -0,0 +1,232 @@
+import os, hmac, time
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from rest_framework.permissions import BasePermission
+
+"""
+Prometheus metrics of the server. Every worker process records its own values,
+with PROMETHEUS_MULTIPROC_DIR set they are written to files in that directory
+and `/metrics` adds up the files of all workers, so any worker can be scraped
+"""
+
+# the key pool and reaper containers never run the server command that creates
+# it, and the first metric defined would fail on the missing directory
+if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+HTTP_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+# 1 KiB to 4 GiB
+SIZE_BUCKETS = tuple(1024 * 4**i for i in range(12))
+
+REQUEST_SECONDS = Histogram(
+    "fshare_request_duration_seconds",
+    "Time until a view returns its response, streamed bodies are not included.",
+    ["view", "method"],
+)
+REQUESTS = Counter(
+    "fshare_requests_total",
+    "Responses by view and status code.",
+    ["view", "method", "status"],
+)
+REQUEST_DB_QUERIES = Histogram(
+    "fshare_request_db_queries",
+    "Database queries made while handling a request.",
+    ["view"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 200),
+)
+REQUEST_DB_SECONDS = Histogram(
+    "fshare_request_db_duration_seconds",
+    "Time spent in database queries while handling a request.",
+    ["view"],
+)
+
+ENCRYPTED_BYTES = Counter(
+    "fshare_encrypted_bytes_total",
+    "Plaintext bytes encrypted with the server key.",
+    ["scheme"],
+)
+DECRYPTED_BYTES = Counter(
+    "fshare_decrypted_bytes_total",
+    "Plaintext bytes decrypted with the server key.",
+    ["scheme"],
+)
+RSA_WRAP_SECONDS = Histogram(
+    "fshare_rsa_wrap_duration_seconds",
+    "Time of wrapping a file key with the public key of a recipient.",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
+PASSWORD_HASH_SECONDS = Histogram(
+    "fshare_password_hash_duration_seconds",
+    "Time of hashing or checking a password, or deriving a key from one.",
+    ["operation"],
+)
+
+FILE_UPLOAD_BYTES = Histogram(
+    "fshare_file_upload_size_bytes",
+    "Size of uploaded files as received from the client.",
+    buckets=SIZE_BUCKETS,
+)
+FILE_DOWNLOAD_BYTES = Histogram(
+    "fshare_file_download_size_bytes",
+    "Size of the bodies of shared file responses, hand offs to nginx excluded.",
+    buckets=SIZE_BUCKETS,
+)
+
+
+class KeyPoolCollector:
+    """
+    Depth of the pre-generated key pool, counted in the database at scrape time
+    since the pool is drained by the workers and filled by its own container.
+    """
+
+    def describe(self):
+        # keeps the registry from collecting, and querying, when registering
+        return [GaugeMetricFamily("fshare_key_pool_depth", "")]
+
+    def collect(self):
+        from auth_app.key_pool import key_pool_depth
+
+        yield GaugeMetricFamily(
+            "fshare_key_pool_depth",
+            "RSA key pairs left in the registration key pool.",
+            value=key_pool_depth(),
+        )
+
+
+REGISTRY.register(KeyPoolCollector())
+
+
+def get_metrics_registry():
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(KeyPoolCollector())
+
+    return registry
+
+
+class CanReadMetrics(BasePermission):
+    """
+    Scrapes from the addresses in METRICS_ALLOWED_IPS, or bearing METRICS_TOKEN.
+    The peer address is used as is, nginx does not proxy `/metrics`.
+    """
+
+    def has_permission(self, request, view):
+        if request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS:
+            return True
+
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+
+        return bool(
+            settings.METRICS_TOKEN
+            and scheme.lower() == "bearer"
+            and hmac.compare_digest(token, settings.METRICS_TOKEN)
+        )
+
+
+@dataclass
+class QueryStats:
+    count: int = 0
+    seconds: float = 0.0
+
+
+_query_stats = ContextVar("query_stats", default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _query_stats.get()
+
+    if stats is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.count += 1
+        stats.seconds += time.perf_counter() - start
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    # first in the list, wrappers entered with `execute_wrapper` pop from the end
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+class MetricsMiddleware:
+    """
+    Records the latency and the database queries of every request, labelled
+    with the URL name of its view. Queries are counted on whichever thread
+    runs them, the stats follow the request's context into `sync_to_async`.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        stats = QueryStats()
+        token = _query_stats.set(stats)
+        start = time.perf_counter()
+
+        try:
+            response = self.get_response(request)
+        finally:
+            _query_stats.reset(token)
+
+        self.observe(request, response, time.perf_counter() - start, stats)
+
+        return response
+
+    async def __acall__(self, request):
+        stats = QueryStats()
+        token = _query_stats.set(stats)
+        start = time.perf_counter()
+
+        try:
+            response = await self.get_response(request)
+        finally:
+            _query_stats.reset(token)
+
+        self.observe(request, response, time.perf_counter() - start, stats)
+
+        return response
+
+    def observe(self, request, response, seconds, stats):
+        resolver_match = getattr(request, "resolver_match", None)
+        # unmatched paths would each get their own series
+        view = resolver_match.view_name if resolver_match else "unmatched"
+        method = request.method if request.method in HTTP_METHODS else "other"
+
+        REQUEST_SECONDS.labels(view, method).observe(seconds)
+        REQUESTS.labels(view, method, response.status_code).inc()
+        REQUEST_DB_QUERIES.labels(view).observe(stats.count)
+        REQUEST_DB_SECONDS.labels(view).observe(stats.seconds)
@@ -38,7 +38,7 @@ CORS_ALLOWED_ORIGINS = os.environ.get("CORS_ALLOWED_ORIGINS", "").split(",")
 
 CORS_ALLOWS_CREDENTIALS = True
 
-CORS_ALLOW_HEADERS = list(default_headers)
+CORS_ALLOW_HEADERS = list(default_headers) + ["idempotency-key"]
 
 
 REST_FRAMEWORK = {
@@ -48,6 +48,9 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
+    # proxies in front of the server appending to X-Forwarded-For, the client
+    # address throttles key on is the entry they added
+    "NUM_PROXIES": int(os.environ.get("NUM_PROXIES", 0)),
 }
 
 SIMPLE_JWT = {
@@ -71,6 +74,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so the latency covers every other middleware
+    "server.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -80,6 +85,7 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    "server.db_router.ReadReplicaMiddleware",
 ]
 
 ROOT_URLCONF = "server.urls"
@@ -106,13 +112,108 @@ WSGI_APPLICATION = "server.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "data" / "db.sqlite3",
+DB_ENGINE = os.environ.get("DB_ENGINE", "sqlite")  # sqlite | postgres
+
+if DB_ENGINE == "postgres":
+    DB_POOL = os.environ.get("DB_POOL", "False") == "True"
+
+    def postgres_database(host, port):
+        database = {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("DB_NAME", "fshare"),
+            "USER": os.environ.get("DB_USER", "fshare"),
+            "PASSWORD": os.environ.get("DB_PASSWORD", ""),
+            "HOST": host,
+            "PORT": port,
+            # persistent connections, checked before reuse. the pool manages its own
+            # connections and cannot be combined with CONN_MAX_AGE
+            "CONN_MAX_AGE": (
+                0 if DB_POOL else int(os.environ.get("DB_CONN_MAX_AGE", 60))
+            ),
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {},
+        }
+
+        if DB_POOL:
+            database["OPTIONS"]["pool"] = {
+                "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", 2)),
+                "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", 10)),
+                "timeout": 10,
+            }
+
+        return database
+
+    DATABASES = {
+        "default": postgres_database(
+            os.environ.get("DB_HOST", "127.0.0.1"), os.environ.get("DB_PORT", "5432")
+        ),
+    }
+
+    if os.environ.get("DB_REPLICA_HOST"):
+        DATABASES["replica"] = postgres_database(
+            os.environ.get("DB_REPLICA_HOST"), os.environ.get("DB_REPLICA_PORT", "5432")
+        )
+        # tests run against the primary, the replica is a streaming copy of it
+        DATABASES["replica"]["TEST"] = {"MIRROR": "default"}
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "data" / "db.sqlite3",
+            "OPTIONS": {
+                # WAL lets readers run alongside the single writer, NORMAL only fsyncs
+                # at checkpoints and the mmap size is in bytes
+                "init_command": (
+                    "PRAGMA journal_mode=WAL;"
+                    "PRAGMA synchronous=NORMAL;"
+                    "PRAGMA mmap_size=268435456;"
+                ),
+                # take the write lock when the transaction starts so concurrent writers
+                # queue on the busy timeout instead of failing with "database is locked"
+                "transaction_mode": "IMMEDIATE",
+                # seconds to wait for the write lock
+                "timeout": 20,
+            },
+        }
     }
+
+# Views with `read_replica = True` read from the "replica" alias when it is configured
+DATABASE_ROUTERS = ["server.db_router.ReadReplicaRouter"]
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # rendered TOTP QR codes embed the MFA secret, so they stay process local
+    # and live as long as an MFA temp token, TIMEOUT is set below with
+    # MFA_TOKEN_TIME_LIMIT_IN_MINS
+    "totp_qr": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "totp-qr",
+        "OPTIONS": {"MAX_ENTRIES": 1000},
+    },
+    # resolved shares of `SharedFileAccessView`, see `file_app.share_access`
+    "share_access": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "share-access",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
 }
 
+# a cache shared by all processes, e.g. redis://127.0.0.1:6379/0, needs redis-py.
+# without it every process caches on its own and only invalidates its own entries
+if os.environ.get("CACHE_REDIS_URL"):
+    for alias in ["default", "share_access"]:
+        CACHES[alias] = {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ.get("CACHE_REDIS_URL"),
+            "KEY_PREFIX": alias,
+        }
+
 
 AUTH_USER_MODEL = "auth_app.User"
 AUTHENTICATION_BACKENDS = [
@@ -170,6 +271,128 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 
 # mfa temp token will be valid for the specified minutes
 MFA_TOKEN_TIME_LIMIT_IN_MINS = 15
+CACHES["totp_qr"]["TIMEOUT"] = MFA_TOKEN_TIME_LIMIT_IN_MINS * 60
+
+# "svg" renders the TOTP QR code without Pillow, "png" uses Pillow
+TOTP_QR_IMAGE_FORMAT = "svg"
 
 # 5 MB file size limit
 FILE_SIZE_LIMIT_IN_MB = 5
+
+# resumable upload sessions stage their chunks here until they are completed,
+# on local disk whatever BLOB_STORAGE is. every process serving the upload
+# endpoints and the reaper have to share this directory, e.g. one volume, or a
+# chunk landing on another host does not find the session's staged file
+UPLOAD_STAGING_ROOT = MEDIA_ROOT / "uploads"
+
+# unfinished upload sessions are purged after this many minutes
+UPLOAD_SESSION_TTL_IN_MINS = 24 * 60
+
+# unfinished upload sessions a user may have open at once, each holds a staged
+# file of up to its declared size
+UPLOAD_SESSION_MAX_OPEN_PER_USER = 10
+
+# a single chunk has to stay below nginx's `client_max_body_size`
+UPLOAD_CHUNK_SIZE_LIMIT_IN_MB = 5
+
+# plaintext bytes per independently authenticated segment of a stored file
+FILE_ENCRYPTION_SEGMENT_SIZE = 64 * 1024
+
+# number of parsed recipient public keys kept in memory per process
+PUBLIC_KEY_CACHE_SIZE = 1024
+
+# threads used to wrap a file key for its recipients, and the recipient count
+# below which the keys are wrapped on the request thread
+KEY_WRAP_WORKERS = 4
+KEY_WRAP_PARALLEL_THRESHOLD = 16
+
+# pre-generated RSA key pairs for registration, `manage.py fill_key_pool`
+# tops the pool up to the target size once it drops below the low-water mark
+KEY_POOL_TARGET_SIZE = 50
+KEY_POOL_LOW_WATER_MARK = 20
+
+# processes per worker that hash passwords and derive the private key
+# encryption key at registration, 0 runs them on the request thread
+PASSWORD_HASHING_WORKERS = 2
+
+# admin user search totals are cached per search term for this many minutes,
+# creating or deleting a user invalidates them in the current process earlier
+USER_COUNT_CACHE_TTL_IN_MINS = 5
+
+# `manage.py reap_expired_files` leaves blobs without a `File` row alone for this
+# many minutes after they were written, their upload may not have committed yet
+REAPER_ORPHAN_GRACE_IN_MINS = 60
+
+# minutes between reaper runs on a thread of each web process, 0 disables it
+# in favour of running `manage.py reap_expired_files --interval` separately
+REAPER_INTERVAL_IN_MINS = 0
+
+# responses of uploads sent with an `Idempotency-Key` header are replayed to
+# retries for this many minutes, a first request that has not finished after the
+# lock timeout is assumed to have died and its key can be claimed again
+IDEMPOTENCY_KEY_TTL_IN_MINS = 24 * 60
+IDEMPOTENCY_KEY_LOCK_TIMEOUT_IN_MINS = 5
+
+# where encrypted file blobs are stored, "local" keeps them under MEDIA_ROOT and
+# "s3" in an S3 compatible bucket such as AWS S3 or MinIO, which needs boto3.
+# a dotted path to a `file_app.storage.BlobStorage` subclass works as well
+BLOB_STORAGE = os.environ.get("BLOB_STORAGE", "local")
+
+S3_STORAGE = {
+    "BUCKET": os.environ.get("S3_BUCKET", ""),
+    "PREFIX": os.environ.get("S3_PREFIX", ""),
+    # e.g. http://127.0.0.1:9000 for MinIO, empty for AWS
+    "ENDPOINT_URL": os.environ.get("S3_ENDPOINT_URL", ""),
+    "REGION": os.environ.get("S3_REGION", ""),
+    "ACCESS_KEY_ID": os.environ.get("S3_ACCESS_KEY_ID", ""),
+    "SECRET_ACCESS_KEY": os.environ.get("S3_SECRET_ACCESS_KEY", ""),
+    "ADDRESSING_STYLE": os.environ.get("S3_ADDRESSING_STYLE", "auto"),
+    # S3 requires parts of at least 5 MB except for the last one
+    "MULTIPART_PART_SIZE": int(os.environ.get("S3_MULTIPART_PART_SIZE_IN_MB", 8))
+    * 1024
+    * 1024,
+    "MAX_POOL_CONNECTIONS": int(os.environ.get("S3_MAX_POOL_CONNECTIONS", 32)),
+}
+
+# server side encryption wrapped around newly uploaded blobs, which are already
+# encrypted by the client. "aesgcm_stream" encrypts them with
+# SERVER_FILE_ENCRYPTION_KEY, "none" stores them as uploaded and relies on disk
+# or volume encryption at rest, letting them be served with sendfile
+FILE_STORAGE_ENCRYPTION_SCHEME = os.environ.get(
+    "FILE_STORAGE_ENCRYPTION_SCHEME", "aesgcm_stream"
+)
+
+# how blobs stored without server side encryption are sent. "" uses
+# `FileResponse`, which the WSGI server sends with sendfile, "nginx" hands them
+# to nginx through `X-Accel-Redirect` to an internal location aliasing MEDIA_ROOT
+FILE_SENDFILE_BACKEND = os.environ.get("FILE_SENDFILE_BACKEND", "")
+FILE_SENDFILE_NGINX_LOCATION = "/protected-media/"
+
+# resolved shares are cached for at most this many minutes, and never past their
+# expiry. changes made by another process reach a process local cache only
+# once its entry times out, use CACHE_REDIS_URL to share invalidations
+SHARE_ACCESS_CACHE_TTL_IN_MINS = 5
+
+# serve uploads and shared file access from async views, which stream downloads
+# without holding a thread per transfer. on by default under ASGI, see asgi.py.
+# under WSGI Django would buffer their responses whole, so keep it off there
+ASYNC_FILE_VIEWS = os.environ.get("ASYNC_FILE_VIEWS", "False") == "True"
+
+# token buckets throttling the CPU heavy auth endpoints, one per client IP and
+# one per user. an IP bucket holds up to AUTH_THROTTLE_BURST tokens and regains
+# AUTH_THROTTLE_TOKENS_PER_MIN a minute, each request spends the `throttle_cost`
+# of its view. a user bucket allows AUTH_THROTTLE_USER_BURST failed password or
+# TOTP attempts, regaining AUTH_THROTTLE_USER_TOKENS_PER_MIN a minute, from any
+# number of addresses.
+# the buckets live in the default cache, without CACHE_REDIS_URL that is process
+# local and every worker process allows the full rate on its own, with N workers
+# a client gets N times the budget
+AUTH_THROTTLE_BURST = 30
+AUTH_THROTTLE_TOKENS_PER_MIN = 10
+AUTH_THROTTLE_USER_BURST = 10
+AUTH_THROTTLE_USER_TOKENS_PER_MIN = 1
+
+# who may read `/metrics`: these peer addresses, or requests with the header
+# `Authorization: Bearer <METRICS_TOKEN>` when a token is set
+METRICS_ALLOWED_IPS = os.environ.get("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",")
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
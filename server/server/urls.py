@@ -1,11 +1,13 @@
 from django.contrib import admin
 from django.urls import path, include
 
-from .views import HealthCheckView
+from .views import HealthCheckView, MetricsView
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/auth/", include("auth_app.urls")),
     path("api/files/", include("file_app.urls")),
     path("api/health/", HealthCheckView.as_view(), name="health_check"),
+    # scraped from the server directly, nginx only proxies the paths above
+    path("metrics", MetricsView.as_view(), name="metrics"),
 ]
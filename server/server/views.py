@@ -1,6 +1,9 @@
 from rest_framework.views import APIView
 from rest_framework import status
 from django.http import HttpResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from .metrics import CanReadMetrics, get_metrics_registry
 
 
 class HealthCheckView(APIView):
@@ -10,3 +13,14 @@ class HealthCheckView(APIView):
         response = HttpResponse("OK", content_type="text/plain")
         response.status_code = status.HTTP_200_OK
         return response
+
+
+class MetricsView(APIView):
+    # the scraper's token is not a JWT
+    authentication_classes = []
+    permission_classes = [CanReadMetrics]
+
+    def get(self, request):
+        return HttpResponse(
+            generate_latest(get_metrics_registry()), content_type=CONTENT_TYPE_LATEST
+        )